@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import requests
 import json
@@ -7,234 +7,336 @@ import hmac
 import hashlib
 import time
 import base64
+import os
+import atexit
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from scoring_engine import AGE_MULTIPLIERS, SKIN_TYPES
+from ingredient_database import IngredientDatabase
+from ingredient_tokenizer import tokenize_ingredients
+from http_client import HttpClient
+from product_cache import ProductCache, MISSING
+from product_sources import ProductSource, ProductSourceChain, ProductSourceError, normalize_barcode
+from memo_cache import MemoCache
+from single_flight import SingleFlight
+from lazy_client import LazyClient, READY
+from gemini_analyzer import GeminiAnalyzer
+from gemini_calls import DeadlineExceeded, generate_json
+from scan_tracker import ScanTracker, make_backend
+from upstream_budget import UpstreamBudget, BudgetExceeded
+from recommendation_jobs import RecommendationJobs, PENDING
+from response_cache import ResponseCache, etag_matches
+from metrics import Metrics, StructuredLog, trace
 
 # INCI Beauty API credentials
 ACCESS_KEY = #accesskey
 SECRET_KEY = #secretkey
+INCI_BASE_URL = os.environ.get('INCI_BASE_URL', 'https://api.incibeauty.com')
 
 # Gemini API Key for AI recommendations
 GEMINI_API_KEY = #geminiapi
 
 # SerpAPI Key for product recommendations
 SERPAPI_KEY = #serpapi
+SERPAPI_URL = os.environ.get('SERPAPI_URL', "https://serpapi.com/search")
+RECOMMENDATIONS_DEADLINE = float(os.environ.get('RECOMMENDATIONS_DEADLINE', 8))  # seconds for the whole SerpAPI fan-out
+SERPAPI_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix='serpapi')
+SERPAPI_FLIGHT = SingleFlight()  # Concurrent link/image searches for the same title share one call
+
+# Stage timings, upstream outcomes and cache counters, served on /metrics in Prometheus format
+METRICS = Metrics('dermascan')
+METRICS.describe('requests_total', 'counter', 'Requests by endpoint, status and response cache outcome')
+METRICS.describe('request_seconds', 'histogram', 'End-to-end request latency')
+METRICS.describe('batch_items_total', 'counter', 'Items streamed by /analyze/batch by status')
+METRICS.describe('cache_hits_total', 'counter', 'Cache hits')
+METRICS.describe('cache_misses_total', 'counter', 'Cache misses')
+METRICS.describe('cache_entries', 'gauge', 'Entries currently held in each cache')
+METRICS.describe('circuit_open', 'gauge', '1 while a product source circuit breaker is open')
+METRICS.describe('recommendation_jobs_pending', 'gauge', 'Recommendation jobs queued or running')
+METRICS.describe('single_flight_calls_total', 'counter', 'Calls that went upstream, per coalescing layer')
+METRICS.describe('single_flight_coalesced_total', 'counter', 'Calls that waited on an identical in-flight call instead')
+METRICS.describe('upstream_budget_remaining', 'gauge', 'Calls left in today\'s budget per metered upstream')
+METRICS.describe('upstream_budget_denied_total', 'counter', 'Upstream calls skipped by the rate limit, daily budget or a 429 back-off')
+
+# One JSON line per event; routine per-request events are sampled (LOG_SAMPLE_RATE, 0..1), errors are not
+LOG = StructuredLog(sample_rate=float(os.environ.get('LOG_SAMPLE_RATE', 0.01)))
+
+# Pooled keep-alive sessions for every upstream, with retries on 429/5xx
+HTTP_CLIENT = HttpClient({
+    'incibeauty': {'timeout': 10, 'retries': 2},
+    # A SerpAPI 429 is not retried: the budget backs off and the request degrades instead of stalling
+    'serpapi': {'timeout': 10, 'retries': 1, 'pool_maxsize': 64, 'retry_statuses': (500, 502, 503, 504)},
+}, metrics=METRICS)
 
-# Initialize Gemini AI for recommendations
-try:
+def create_gemini_model():
     import google.generativeai as genai
     genai.configure(api_key=GEMINI_API_KEY)  # type: ignore
-    gemini_model = genai.GenerativeModel("gemini-1.5-flash")  # type: ignore
-    AI_AVAILABLE = True
-    print("AI recommendations enabled")
-except Exception as e:
-    print(f"AI not available: {e}")
-    AI_AVAILABLE = False
+    return genai.GenerativeModel("gemini-1.5-flash")  # type: ignore
+
+# Gemini AI for recommendations: imported and constructed in the background once the server takes
+# requests (never at import), retried every GEMINI_INIT_RETRY_INTERVAL seconds if that fails.
+# Until it is ready, recommendations come from the cache or the basic rules.
+GEMINI = LazyClient('Gemini', create_gemini_model, retry_interval=float(os.environ.get('GEMINI_INIT_RETRY_INTERVAL', 60)),
+                    log=LOG)
+# Seconds a request waits for a complete recommendations answer before falling back to the basic rules
+GEMINI_DEADLINE = float(os.environ.get('GEMINI_DEADLINE', 8))
+RECOMMENDATIONS_SCHEMA = {'products': [str], 'tips': [str], 'avoid_ingredients': [str], 'look_for_ingredients': [str]}
+
+# Gemini recommendations depend only on (age, gender, skinType), so they are memoized per profile.
+# Set RECOMMENDATION_CACHE_DB to a file path to keep them across restarts.
+RECOMMENDATION_CACHE = MemoCache(
+    ttl=int(os.environ.get('RECOMMENDATION_CACHE_TTL', 24 * 3600)),  # seconds
+    stale_ttl=int(os.environ.get('RECOMMENDATION_CACHE_STALE_TTL', 7 * 24 * 3600)),  # served while refreshing
+    db_path=os.environ.get('RECOMMENDATION_CACHE_DB'),
+    table='recommendations',
+    log=LOG
+)
+PROFILE_GENDERS = ['female', 'male', 'other']
+# Precompute them for every profile when a serving process starts (each worker under server.py;
+# with RECOMMENDATION_CACHE_DB the later workers find them in the file)
+WARM_RECOMMENDATIONS = bool(os.environ.get('WARM_RECOMMENDATIONS'))
+
+# SerpAPI alternatives depend only on the search query (product type, skin type, ingredients to look for)
+ALTERNATIVES_CACHE = MemoCache(
+    ttl=int(os.environ.get('ALTERNATIVES_CACHE_TTL', 6 * 3600)),  # seconds
+    stale_ttl=int(os.environ.get('ALTERNATIVES_CACHE_STALE_TTL', 24 * 3600)),  # served while refreshing
+    max_entries=4096,
+    db_path=os.environ.get('ALTERNATIVES_CACHE_DB'),
+    table='alternatives',
+    log=LOG
+)
+# How often to pre-warm the (product type, skin type) queries and the most requested ones (0 disables)
+ALTERNATIVES_WARM_INTERVAL = float(os.environ.get('ALTERNATIVES_WARM_INTERVAL', 0))
+ALTERNATIVES_WARM_TOP = int(os.environ.get('ALTERNATIVES_WARM_TOP', 50))
+QUERY_POPULARITY = Counter()
+QUERY_POPULARITY_LOCK = threading.Lock()
+
+# /analyze returns the analysis right away; product alternatives are resolved by these background jobs.
+# Set RECOMMENDATION_JOBS_DB to a file path so that any worker process can answer a job poll
+# (server.py sets one up when it runs more than one worker).
+RECOMMENDATION_JOBS = RecommendationJobs(
+    max_workers=int(os.environ.get('RECOMMENDATION_WORKERS', 8)),
+    ttl=int(os.environ.get('RECOMMENDATION_JOB_TTL', 600)),  # seconds a job id stays valid
+    db_path=os.environ.get('RECOMMENDATION_JOBS_DB'),
+    log=LOG
+)
+RECOMMENDATION_WAIT_MAX = 30  # seconds a client may long-poll or stream a job
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024  # request bodies beyond this get a 413
 CORS(app)
 
-# Load harmful ingredients database
-def load_bad_ingredients():
-    try:
-        with open('data/bad_ingredients.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("bad_ingredients.json not found.")
-        return {}
+# Harmful ingredients and recommendations databases, compiled into an immutable snapshot
+# (matcher, score weights, name -> category map). The files are read relative to this
+# module; DATABASE_WATCH_INTERVAL (seconds) polls them and swaps in a new snapshot on change.
+# Per-token classifications are memoized across requests (CLASSIFICATION_CACHE_SIZE entries);
+# set CLASSIFICATION_CACHE_FILE to save the most frequent ones every
+# CLASSIFICATION_CACHE_SAVE_INTERVAL seconds and at exit, and preload them at startup.
+DATABASE = IngredientDatabase(classification_file=os.environ.get('CLASSIFICATION_CACHE_FILE'))
+DATABASE.watch(float(os.environ.get('DATABASE_WATCH_INTERVAL', 0)))
+CLASSIFICATION_CACHE_SAVE_INTERVAL = float(os.environ.get('CLASSIFICATION_CACHE_SAVE_INTERVAL', 300))
 
-# Load skincare recommendations
-def load_skincare_recommendations():
-    try:
-        with open('data/skincare_recommendations.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(" skincare_recommendations.json not found.")
-        return {}
+# Token for POST /admin/reload-database; the endpoint is disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Set by server.py: the pre-fork master, which reloads the database for every worker on SIGHUP
+RELOAD_MASTER_PID = None
 
-BAD_INGREDIENTS = load_bad_ingredients()
-SKINCARE_RECOMMENDATIONS = load_skincare_recommendations()
+# Product lookups cached by barcode; set PRODUCT_CACHE_DB to a file path to keep them across restarts
+PRODUCT_CACHE = ProductCache(
+    ttl=int(os.environ.get('PRODUCT_CACHE_TTL', 24 * 3600)),  # seconds
+    negative_ttl=int(os.environ.get('PRODUCT_CACHE_NEGATIVE_TTL', 15 * 60)),  # seconds, for unknown barcodes
+    max_entries=int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 10000)),
+    max_bytes=int(os.environ.get('PRODUCT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    db_path=os.environ.get('PRODUCT_CACHE_DB')
+)
 
-# Simple scan cache to avoid hammering the API
-recent_scans = {}
-SCAN_TIMEOUT = 10  # seconds
+# Serialized /analyze responses keyed by (barcode or ingredients hash, profile, database version),
+# revalidated by clients with ETag / If-None-Match
+RESPONSE_CACHE = ResponseCache(
+    ttl=int(os.environ.get('RESPONSE_CACHE_TTL', 3600)),  # seconds; bounds how long product alternatives are reused
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000)),
+    max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+)
+RESPONSE_CACHE_CONTROL = f"private, max-age={int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 300))}"
 
-def has_scanned_recently(barcode):
-    now = time.time()
-    if barcode in recent_scans and now - recent_scans[barcode] < SCAN_TIMEOUT:
-        return True
-    recent_scans[barcode] = now
-    return False
+# Identical /analyze requests arriving together are computed once
+RESPONSE_FLIGHT = SingleFlight()
 
-# Parse ingredients string into list
+# Per-client rate limiting keeps its windows in a bounded store: in-process shards by default, or
+# SCAN_TRACKER_URL (sqlite:///path.db or redis://host:port/0) to share it between processes.
+# An in-process store expires windows oldest first, so each window length gets a store of its own.
+SCAN_TRACKER_BACKEND = make_backend(
+    os.environ.get('SCAN_TRACKER_URL'),
+    max_entries=int(os.environ.get('SCAN_TRACKER_MAX_ENTRIES', 100000))
+)
+SCAN_RATE_LIMIT = int(os.environ.get('SCAN_RATE_LIMIT', 0))  # /analyze requests per client per window, 0 disables
+SCAN_RATE_WINDOW = int(os.environ.get('SCAN_RATE_WINDOW', 60))  # seconds
+CLIENT_SCANS = ScanTracker(SCAN_RATE_WINDOW, SCAN_TRACKER_BACKEND)
+
+# Metered upstreams: calls per second and per UTC day (0 = unlimited), counted in the same kind of
+# store as the scan tracker (shared by every worker with SCAN_TRACKER_URL). One-second rate windows
+# and day-long budget windows each have their own store, apart from the churn of client keys.
+# As SerpAPI's budget runs low, product alternatives skip image lookups, then link lookups,
+# then are served from cache or the curated product lists.
+BUDGET_BACKEND = make_backend(os.environ.get('SCAN_TRACKER_URL'), max_entries=1024)
+BUDGET_RATE_BACKEND = make_backend(os.environ.get('SCAN_TRACKER_URL'), max_entries=1024)
+SERPAPI_BUDGET = UpstreamBudget(
+    'serpapi', BUDGET_BACKEND, rate_backend=BUDGET_RATE_BACKEND,
+    rate=float(os.environ.get('SERPAPI_RATE_LIMIT', 0)),
+    daily_limit=int(os.environ.get('SERPAPI_DAILY_BUDGET', 0)),
+    log=LOG
+)
+GEMINI_BUDGET = UpstreamBudget(
+    'gemini', BUDGET_BACKEND, rate_backend=BUDGET_RATE_BACKEND,
+    rate=float(os.environ.get('GEMINI_RATE_LIMIT', 0)),
+    daily_limit=int(os.environ.get('GEMINI_DAILY_BUDGET', 0)),
+    log=LOG
+)
+BUDGET_SKIP_IMAGES_BELOW = float(os.environ.get('BUDGET_SKIP_IMAGES_BELOW', 0.5))  # share of the daily budget left
+BUDGET_SKIP_LINKS_BELOW = float(os.environ.get('BUDGET_SKIP_LINKS_BELOW', 0.2))
+THROTTLE_DEFAULT = 60  # seconds to back off after a 429 without a usable Retry-After
+
+# Optional deep analysis ("deep_analysis": true in /analyze): Gemini reviews the whole ingredient list.
+# Results are cached per ingredient set and profile; concurrent misses are packed into one prompt
+# (up to GEMINI_BATCH_SIZE products, collected for at most GEMINI_BATCH_WAIT seconds).
+DEEP_ANALYZER = GeminiAnalyzer(
+    GEMINI.get,
+    cache=MemoCache(
+        ttl=int(os.environ.get('GEMINI_ANALYSIS_CACHE_TTL', 7 * 24 * 3600)),  # seconds
+        max_entries=int(os.environ.get('GEMINI_ANALYSIS_CACHE_MAX_ENTRIES', 10000)),
+        db_path=os.environ.get('GEMINI_ANALYSIS_CACHE_DB'),
+        table='analysis',
+        log=LOG
+    ),
+    max_batch_size=int(os.environ.get('GEMINI_BATCH_SIZE', 8)),
+    max_wait=float(os.environ.get('GEMINI_BATCH_WAIT', 0.05)),
+    # Seconds a request waits for its analysis; the same per-request deadline as recommendations by default
+    timeout=float(os.environ.get('GEMINI_ANALYSIS_TIMEOUT', GEMINI_DEADLINE)),
+    budget=GEMINI_BUDGET,
+    metrics=METRICS,
+    log=LOG
+)
+
+def rate_limited(client):
+    """True if the client is over SCAN_RATE_LIMIT; fails open if the shared store is unavailable"""
+    if not SCAN_RATE_LIMIT or not client:
+        return False
+    try:
+        return CLIENT_SCANS.hit('client:' + client) > SCAN_RATE_LIMIT
+    except Exception as e:
+        LOG.error('scan_tracker_failed', error=str(e))
+        return False
+
+# Parse ingredients string into a list of canonical INCI tokens
 def parse_ingredients(ingredients_text):
     if not ingredients_text:
         return []
-    return [i.strip().lower() for i in re.split(r'[,;.\n\u2022]', ingredients_text) if i.strip()]
+    with METRICS.span('parse'):
+        return list(tokenize_ingredients(ingredients_text))
 
 # Check for harmful ingredients
-def analyze_ingredients(ingredients_list):
-    harmful_found = {}
-    total_harmful = 0
-    total_weightage = 0
-    found_ingredients = set()  # Track found ingredients to avoid duplicates
-    
-    for ingredient in ingredients_list:
-        for category, data in BAD_INGREDIENTS.items():
-            for bad in data['ingredients']:
-                if bad.lower() in ingredient and ingredient not in found_ingredients:
-                    if category not in harmful_found:
-                        harmful_found[category] = {
-                            'description': data['description'],
-                            'severity': data.get('severity', 'MODERATE'),
-                            'weightage': data.get('weightage', 10),
-                            'ingredients': []
-                        }
-                    harmful_found[category]['ingredients'].append(ingredient)
-                    found_ingredients.add(ingredient)  # Mark as found
-                    total_harmful += 1
-                    total_weightage += data.get('weightage', 10)
-    
-    # Calculate safety score based on weightages
-    safety_score = max(0, 100 - total_weightage)
-    
-    return {
-        'safe': total_harmful == 0,
-        'harmful_count': total_harmful,
-        'total_weightage': total_weightage,
-        'harmful_ingredients': harmful_found,
-        'total_ingredients_checked': len(ingredients_list),
-        'safety_score': safety_score
-    }
+def analyze_ingredients(ingredients_list, detection=None, engine=None):
+    engine = engine or DATABASE.current.engine
+    if detection is None:
+        with METRICS.span('match'):
+            detection = engine.detect(ingredients_list)
+    return engine.analyze(ingredients_list, detection)
 
 # Fetch product info from INCI Beauty
-def get_product_info_from_incibeauty(ean):
-    try:
-        path = f"/product/composition/{ean}/en_GB?accessKeyId={ACCESS_KEY}"
-        hmac_signature = hmac.new(
-            SECRET_KEY.encode("utf-8"),
-            path.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
+def get_product_info_from_incibeauty(ean, timeout=10):
+    """Return the product, None if INCI Beauty does not know the barcode; raises ProductSourceError on failure"""
+    cached = PRODUCT_CACHE.get(ean)
+    if cached is not MISSING:
+        return cached
 
-        url = f"https://api.incibeauty.com{path}&hmac={hmac_signature}"
-        print("Calling:", url)
+    path = f"/product/composition/{ean}/en_GB?accessKeyId={ACCESS_KEY}"
+    hmac_signature = hmac.new(
+        SECRET_KEY.encode("utf-8"),
+        path.encode("utf-8"),
+        hashlib.sha256
+    ).hexdigest()
 
-        response = requests.get(url, timeout=10)
+    url = f"{INCI_BASE_URL}{path}&hmac={hmac_signature}"
 
-        if response.status_code == 200:
-            data = response.json()
+    try:
+        with METRICS.span('inci_fetch'):
+            response = HTTP_CLIENT.get('incibeauty', url, timeout=timeout)
+    except requests.RequestException as e:
+        raise ProductSourceError(f"INCI Beauty request failed: {type(e).__name__}")  # The message repeats the signed URL
 
-            # Handle compositions as a list
-            compositions_list = data.get('compositions', [])
-            ingredients_raw = []
+    if response.status_code == 200:
+        data = response.json()
 
-            if compositions_list and isinstance(compositions_list, list):
-                ingredients_raw = compositions_list[0].get('ingredients', [])
+        # Handle compositions as a list
+        compositions_list = data.get('compositions', [])
+        ingredients_raw = []
 
-            ingredients_str = ", ".join([ing.get('name') or ing.get('official_name') for ing in ingredients_raw if ing.get('name') or ing.get('official_name')])
+        if compositions_list and isinstance(compositions_list, list):
+            ingredients_raw = compositions_list[0].get('ingredients', [])
 
-            return {
-                'title': data.get('name', 'Unknown Product'),
-                'brand': data.get('brand', 'Unknown Brand'),
-                'ingredients': ingredients_str,
-                'image': data.get('images', {}).get('image')
-            }
+        ingredients_str = ", ".join([ing.get('name') or ing.get('official_name') for ing in ingredients_raw if ing.get('name') or ing.get('official_name')])
 
-        else:
-            print(f"[INCI] Status Code: {response.status_code} | Body: {response.text}")
+        product_info = {
+            'title': data.get('name', 'Unknown Product'),
+            'brand': data.get('brand', 'Unknown Brand'),
+            'ingredients': ingredients_str,
+            'image': data.get('images', {}).get('image')
+        }
+        PRODUCT_CACHE.set(ean, product_info)
+        return product_info
 
-    except Exception as e:
-        print(f"[INCI Beauty] Error: {e}")
+    if response.status_code == 404:
+        # Unknown barcode: remember it so it is not retried on every scan
+        PRODUCT_CACHE.set(ean, None)
+        return None
 
-    return None
+    LOG.error('inci_error', status=response.status_code, body=response.text[:200])
+    raise ProductSourceError(f"INCI Beauty returned {response.status_code}")
+
+# Barcode lookups: every EAN/UPC variant is tried once per source, concurrently.
+# Each lookup holds one pool thread per variant (2 for a UPC-A/EAN-13 pair) for up to the
+# source timeout, so the pool bounds how many slow lookups can be in flight at once. The
+# default lets every ASGI in-flight slot (asgi.py) run its lookup; threads start on demand.
+PRODUCT_SOURCE_WORKERS = int(os.environ.get('PRODUCT_SOURCE_WORKERS',
+                                            2 * int(os.environ.get('ASGI_MAX_IN_FLIGHT', 256))))
+PRODUCT_SOURCES = ProductSourceChain([
+    ProductSource('INCI Beauty', get_product_info_from_incibeauty, timeout=10),
+], max_workers=PRODUCT_SOURCE_WORKERS, log=LOG)
 
-def get_personalized_analysis(ingredients_list, user_profile):
+# /analyze/batch limits. All batches share BATCH_CONCURRENCY barcode lookups, each holding up
+# to two product source threads; that is capped at a quarter of the pool so batches can never
+# take the threads single scans need
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 5000))
+BATCH_CONCURRENCY = max(1, min(int(os.environ.get('BATCH_CONCURRENCY', 8)), PRODUCT_SOURCE_WORKERS // 8))
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+
+def get_personalized_analysis(ingredients_list, user_profile, detection=None, engine=None):
     """
     Analyze ingredients with personalized scoring based on user profile
     Returns: dict with safety verdict, personalized score, and recommendations
     """
-    harmful_found = {}
-    total_harmful = 0
-    total_weightage = 0
-    found_ingredients = set()  # Track found ingredients to avoid duplicates
-    personalized_score = 100  # Start with perfect score
-
-    # Base analysis with weightages
-    for ingredient in ingredients_list:
-        for category, data in BAD_INGREDIENTS.items():
-            for bad in data['ingredients']:
-                if bad.lower() in ingredient and ingredient not in found_ingredients:
-                    if category not in harmful_found:
-                        harmful_found[category] = {
-                            'description': data['description'],
-                            'severity': data.get('severity', 'MODERATE'),
-                            'weightage': data.get('weightage', 10),
-                            'ingredients': []
-                        }
-                    harmful_found[category]['ingredients'].append(ingredient)
-                    found_ingredients.add(ingredient)  # Mark as found
-                    total_harmful += 1
-                    total_weightage += data.get('weightage', 10)
-
-    # Calculate base safety score using weightages
-    base_safety_score = max(0, 100 - total_weightage)
-    personalized_score = base_safety_score
-
-    # Personalized scoring based on user profile
-    if user_profile:
-        age = user_profile.get('age', '')
-        gender = user_profile.get('gender', '')
-        skin_type = user_profile.get('skinType', '')
-
-        # Age-based adjustments (multiplier for weightage impact)
-        age_multiplier = 1.0
-        if age == 'under_18':
-            # Young skin is more sensitive to all ingredients
-            age_multiplier = 1.3
-        elif age == '18_32':
-            # Young adult skin can handle some ingredients better
-            age_multiplier = 1.0
-        elif age == '32_56':
-            # Mature skin needs gentler ingredients
-            age_multiplier = 1.1
-        elif age == '56_plus':
-            # Senior skin is most sensitive
-            age_multiplier = 1.4
-
-        # Apply age multiplier to weightage
-        adjusted_weightage = total_weightage * age_multiplier
-        personalized_score = max(0, 100 - adjusted_weightage)
-
-        # Skin type adjustments (additional penalties for specific ingredients)
-        if skin_type == 'dry':
-            # Dry skin is more sensitive to drying ingredients
-            for category, data in harmful_found.items():
-                if 'alcohols' in category or 'sulfates' in category:
-                    personalized_score -= data.get('weightage', 10) * 0.2  # Additional 20% penalty
-        elif skin_type == 'oily':
-            # Oily skin can handle some ingredients better but sensitive to comedogenic ones
-            for category, data in harmful_found.items():
-                if 'mineral_oil' in category:
-                    personalized_score -= data.get('weightage', 10) * 0.3  # Additional 30% penalty
-        elif skin_type == 'combination':
-            # Combination skin needs balanced approach
-            personalized_score -= total_weightage * 0.1  # Additional 10% penalty
-
-    # Ensure score doesn't go below 0
-    personalized_score = max(0, personalized_score)
+    # Detect once (unless the caller already did, with the same engine), then score with the precomputed weights for this profile
+    engine = engine or DATABASE.current.engine
+    if detection is None:
+        with METRICS.span('match'):
+            detection = engine.detect(ingredients_list)
+    with METRICS.span('personalize'):
+        personalized_score = engine.personalized_score(detection, user_profile)
 
     # Get personalized recommendations
-    recommendations = get_personalized_recommendations(user_profile)
+    with METRICS.span('recommendations'):
+        recommendations = get_personalized_recommendations(user_profile)
 
-    return {
-        'safe': total_harmful == 0,
-        'harmful_count': total_harmful,
-        'total_weightage': total_weightage,
-        'harmful_ingredients': harmful_found,
-        'total_ingredients_checked': len(ingredients_list),
+    analysis = engine.summary(detection)
+    analysis.update({
         'personalized_score': round(personalized_score),
         'score_category': get_score_category(personalized_score),
         'recommendations': recommendations
-    }
+    })
+    return analysis
 
 def get_score_category(score):
     """Convert numerical score to category"""
@@ -249,19 +351,13 @@ def get_score_category(score):
     else:
         return "Very Poor"
 
-def get_personalized_recommendations(user_profile):
-    """Get AI-powered personalized skincare recommendations based on user profile"""
-    if not user_profile:
-        return None
+def recommendation_profile_key(user_profile):
+    """The (age, gender, skinType) tuple the AI recommendations depend on"""
+    return tuple(str(user_profile.get(field) or '').strip().lower() for field in ('age', 'gender', 'skinType'))
 
-    age = user_profile.get('age', '')
-    gender = user_profile.get('gender', '')
-    skin_type = user_profile.get('skinType', '')
-
-    # Try AI recommendations first
-    if AI_AVAILABLE:
-        try:
-            prompt = f"""
+def generate_ai_recommendations(age, gender, skin_type):
+    """Ask Gemini for recommendations for one profile; raises on failure"""
+    prompt = f"""
 You are a skincare expert. Provide personalized skincare recommendations for this user profile.
 
 User Profile:
@@ -280,16 +376,78 @@ Provide recommendations in this exact JSON format:
 Focus on specific product recommendations and actionable tips for this user's profile.
 """
 
-            response = gemini_model.generate_content(prompt)
-            ai_recommendations = json.loads(response.text)
-            print(f" AI recommendations generated successfully")
-            return ai_recommendations
+    gemini_model = GEMINI.get()
+    if gemini_model is None:
+        raise RuntimeError('Gemini is not ready')
+    if not GEMINI_BUDGET.acquire():
+        raise BudgetExceeded('Gemini budget exhausted')
+
+    outcome = 'exception'
+    METRICS.inc('gemini_calls_total', purpose='recommendations')
+    METRICS.inc('gemini_prompt_bytes_total', len(prompt.encode('utf-8')), purpose='recommendations')
+    try:
+        with METRICS.span('gemini'):
+            ai_recommendations, text = generate_json(gemini_model, prompt, RECOMMENDATIONS_SCHEMA, GEMINI_DEADLINE)
+        METRICS.inc('gemini_response_bytes_total', len(text.encode('utf-8')), purpose='recommendations')
+        outcome = 'ok'
+    except DeadlineExceeded:
+        outcome = 'deadline'
+        raise
+    except Exception as e:
+        if type(e).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+            GEMINI_BUDGET.throttle(THROTTLE_DEFAULT)  # Gemini's 429
+        raise
+    finally:
+        METRICS.inc('upstream_requests_total', upstream='gemini', outcome=outcome)
+    return ai_recommendations
+
+def deep_analysis(ingredients_list, user_profile):
+    """Gemini's analysis of the ingredient list, or None if Gemini is unavailable, failing or too slow"""
+    if not ingredients_list or GEMINI.get() is None:
+        return None
+    try:
+        with METRICS.span('gemini_analysis'):
+            return DEEP_ANALYZER.analyze_ingredients(ingredients_list, user_profile)
+    except Exception as e:
+        LOG.error('deep_analysis_failed', error=f'{type(e).__name__}: {e}')
+        return None
+
+# Ingredients worth looking for per skin type, for the basic recommendations and the alternatives search
+LOOK_FOR_INGREDIENTS = {
+    'dry': ["hyaluronic acid", "ceramides", "glycerin"],
+    'oily': ["niacinamide", "salicylic acid", "zinc"],
+    'combination': ["niacinamide", "hyaluronic acid", "vitamin C"],
+}
+
+def look_for_ingredients(skin_type):
+    """The curated ingredients to look for with a skin type, none for an unknown one"""
+    return LOOK_FOR_INGREDIENTS.get(skin_type, []) if isinstance(skin_type, str) else []
+
+def get_personalized_recommendations(user_profile):
+    """Get AI-powered personalized skincare recommendations based on user profile"""
+    if not user_profile:
+        return None
+
+    age = user_profile.get('age', '')
+    gender = user_profile.get('gender', '')
+    skin_type = user_profile.get('skinType', '')
+
+    # Try AI recommendations first (memoized per profile, only successful answers are cached)
+    key = recommendation_profile_key(user_profile)
+    if GEMINI.get() is not None:
+        try:
+            return RECOMMENDATION_CACHE.get_or_compute(key, lambda: generate_ai_recommendations(*key))
         except Exception as e:
-            print(f" AI recommendations failed: {e}")
+            LOG.error('ai_recommendations_failed', error=str(e))
             # Fall through to basic recommendations
+    else:
+        # Still starting up (or retrying): earlier answers are as good as ever
+        cached = RECOMMENDATION_CACHE.peek(key)
+        if cached is not None:
+            return cached
     
     # Fallback to basic recommendations based on user profile
-    print(f"📝 Using fallback recommendations for {age}, {gender}, {skin_type}")
+    LOG.event('fallback_recommendations', age=age, gender=gender, skin_type=skin_type)
     
     fallback_recommendations = {
         "products": [],
@@ -305,11 +463,6 @@ Focus on specific product recommendations and actionable tips for this user's pr
             "Apply moisturizer while skin is still damp",
             "Avoid hot water when washing face"
         ])
-        fallback_recommendations["look_for_ingredients"].extend([
-            "hyaluronic acid",
-            "ceramides",
-            "glycerin"
-        ])
         fallback_recommendations["avoid_ingredients"].extend([
             "alcohol",
             "fragrance",
@@ -321,11 +474,6 @@ Focus on specific product recommendations and actionable tips for this user's pr
             "Don't skip moisturizer - use lightweight formulas",
             "Consider double cleansing"
         ])
-        fallback_recommendations["look_for_ingredients"].extend([
-            "niacinamide",
-            "salicylic acid",
-            "zinc"
-        ])
         fallback_recommendations["avoid_ingredients"].extend([
             "mineral oil",
             "petrolatum",
@@ -337,11 +485,7 @@ Focus on specific product recommendations and actionable tips for this user's pr
             "Focus on balancing the skin",
             "Consider multi-masking"
         ])
-        fallback_recommendations["look_for_ingredients"].extend([
-            "niacinamide",
-            "hyaluronic acid",
-            "vitamin C"
-        ])
+    fallback_recommendations["look_for_ingredients"].extend(look_for_ingredients(skin_type))
     
     # Age-based recommendations
     if age == 'under_18':
@@ -355,294 +499,544 @@ Focus on specific product recommendations and actionable tips for this user's pr
     
     return fallback_recommendations
 
+RETAILER_SOURCES = [
+    ('amazon.com', "Amazon"),
+    ('target.com', "Target"),
+    ('walmart.com', "Walmart"),
+    ('ulta.com', "Ulta"),
+    ('sephora.com', "Sephora"),
+]
+
+def find_purchase_link(title, timeout=5):
+    """Search major retailers for a product; returns (link, source) or ('', None)"""
+    return SERPAPI_FLIGHT.do(('link', title), lambda: search_purchase_link(title, timeout))
+
+def search_purchase_link(title, timeout):
+    if not SERPAPI_BUDGET.acquire():
+        return '', None
+    link_search_query = f'"{title}" site:amazon.com OR site:target.com OR site:walmart.com OR site:ulta.com OR site:sephora.com'
+    params_link_search = {
+        "q": link_search_query,
+        "api_key": SERPAPI_KEY,
+        "engine": "google",
+        "num": 3,
+        "gl": "us",
+        "hl": "en"
+    }
+    with METRICS.span('serpapi_link'):
+        link_response = HTTP_CLIENT.get('serpapi', SERPAPI_URL, params=params_link_search, timeout=timeout)
+    note_throttling(SERPAPI_BUDGET, link_response)
+
+    if link_response.status_code == 200:
+        link_data = link_response.json()
+        link_results = link_data.get('organic_results', [])
+
+        for link_result in link_results:
+            link_url = link_result.get('link', '')
+            for domain, source in RETAILER_SOURCES:
+                if domain in link_url:
+                    return link_url, source
+    return '', None
+
+def find_product_image(title, timeout=5):
+    """Search Google Images for a product image; returns the image URL or ''"""
+    return SERPAPI_FLIGHT.do(('image', title), lambda: search_product_image(title, timeout))
+
+def search_product_image(title, timeout):
+    if not SERPAPI_BUDGET.acquire():
+        return ''
+    image_query = f"{title} product image"
+    params_image = {
+        "q": image_query,
+        "api_key": SERPAPI_KEY,
+        "engine": "google_images",
+        "num": 1,
+        "gl": "us",
+        "hl": "en"
+    }
+    with METRICS.span('serpapi_image'):
+        image_response = HTTP_CLIENT.get('serpapi', SERPAPI_URL, params=params_image, timeout=timeout)
+    note_throttling(SERPAPI_BUDGET, image_response)
+    if image_response.status_code == 200:
+        image_data = image_response.json()
+        image_results = image_data.get('images_results', [])
+        if image_results:
+            return image_results[0].get('original', '')
+    return ''
+
+def gather_lookups(lookups, deadline):
+    """
+    Run follow-up lookups concurrently and wait for them until the deadline.
+    Returns {key: result} for the lookups that finished in time without raising.
+    Lookups that have not started by the deadline are cancelled.
+    """
+    futures = {SERPAPI_EXECUTOR.submit(fn, *args): key for key, (fn, args) in lookups.items()}
+    if not futures:
+        return {}
+    done, pending = wait(futures, timeout=max(0, deadline - time.monotonic()))
+    for future in pending:
+        future.cancel()
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            # Continue without this result
+            LOG.error('serpapi_lookup_failed', error=str(e))
+    return results
+
+def note_throttling(budget, response):
+    """Back off an upstream that answered 429, for its Retry-After seconds"""
+    if response.status_code != 429:
+        return
+    retry_after = response.headers.get('Retry-After', '')
+    budget.throttle(float(retry_after) if retry_after.isdigit() else THROTTLE_DEFAULT)
+    LOG.error('upstream_throttled', upstream=budget.name, retry_after=retry_after)
+
+def serpapi_degradation():
+    """How much of a SerpAPI lookup today's budget allows: 'full', 'no_images', 'no_links' or 'curated'"""
+    left = SERPAPI_BUDGET.fraction_left()
+    if left <= 0:
+        return 'curated'
+    if left < BUDGET_SKIP_LINKS_BELOW:
+        return 'no_links'
+    if left < BUDGET_SKIP_IMAGES_BELOW:
+        return 'no_images'
+    return 'full'
+
+def remaining_timeout(deadline, timeout):
+    """Clip a request timeout to what is left of the deadline budget"""
+    return max(0.1, min(timeout, deadline - time.monotonic()))
+
+def product_search_type(current_product):
+    """The kind of product to search alternatives for, from the product title"""
+    product_name = current_product.get('title', '').lower()
+    if 'cleanser' in product_name or 'wash' in product_name:
+        return 'gentle cleanser'
+    elif 'moisturizer' in product_name or 'cream' in product_name:
+        return 'moisturizer'
+    elif 'serum' in product_name:
+        return 'serum'
+    elif 'sunscreen' in product_name or 'spf' in product_name:
+        return 'sunscreen'
+    return 'skincare product'
+
+PRODUCT_SEARCH_TYPES = ['gentle cleanser', 'moisturizer', 'serum', 'sunscreen', 'skincare product']
+
+def product_search_query(product_type, user_profile):
+    """
+    Build the SerpAPI query for a product type and user profile. Only the skin type is used, with its
+    curated ingredients to look for (never a Gemini call), so the alternatives cache holds one entry per
+    (product type, skin type) and warm_product_alternatives covers them all.
+    """
+    search_terms = [product_type]
+
+    # Add skin type specific terms
+    skin_type = user_profile.get('skinType', '') if user_profile else ''
+    if skin_type == 'dry':
+        search_terms.append('hydrating')
+        search_terms.append('for dry skin')
+    elif skin_type == 'oily':
+        search_terms.append('oil-free')
+        search_terms.append('for oily skin')
+    elif skin_type == 'combination':
+        search_terms.append('for combination skin')
+    elif skin_type == 'sensitive':
+        search_terms.append('gentle')
+        search_terms.append('for sensitive skin')
+
+    # Add ingredients to look for
+    search_terms.extend(look_for_ingredients(skin_type)[:2])  # Limit to 2 ingredients
+
+    # Build final search query
+    search_query = ' '.join(search_terms)
+    search_query += ' buy online purchase best alternatives'
+    return search_query
+
+def serpapi_configured():
+    return bool(SERPAPI_KEY) and SERPAPI_KEY != "YOUR_SERPAPI_KEY_HERE"
+
 def get_product_recommendations(current_product, user_profile, harmful_ingredients):
     """
     Get product recommendations using SerpAPI based on current product and user profile
     Returns: list of recommended products with images, links, and reviews
     """
-    if not SERPAPI_KEY or SERPAPI_KEY == "YOUR_SERPAPI_KEY_HERE":
-        print("SerpAPI key not configured")
-        return []
-    
+    if not serpapi_configured():
+        LOG.event('serpapi_not_configured')
+        return curated_product_recommendations(current_product, user_profile, harmful_ingredients)
+
     try:
-        # Build search query based on current product and user profile
-        search_terms = []
-        
-        # Get product type from current product name
-        product_name = current_product.get('title', '').lower()
-        if 'cleanser' in product_name or 'wash' in product_name:
-            search_terms.append('gentle cleanser')
-        elif 'moisturizer' in product_name or 'cream' in product_name:
-            search_terms.append('moisturizer')
-        elif 'serum' in product_name:
-            search_terms.append('serum')
-        elif 'sunscreen' in product_name or 'spf' in product_name:
-            search_terms.append('sunscreen')
-        else:
-            search_terms.append('skincare product')
-        
-        # Add skin type specific terms
+        search_query = product_search_query(product_search_type(current_product), user_profile)
+        record_query(search_query)
+        return ALTERNATIVES_CACHE.get_or_compute(search_query, lambda: search_product_alternatives(search_query))
+    except BudgetExceeded:
+        LOG.event('curated_product_recommendations', reason='budget')
+    except Exception as e:
+        LOG.error('product_recommendations_failed', error=str(e))
+    return curated_product_recommendations(current_product, user_profile, harmful_ingredients)
+
+def curated_product_recommendations(current_product, user_profile, harmful_ingredients=None, avoid_ingredients=None):
+    """
+    Alternatives from skincare_recommendations.json for the product category and skin type, without the
+    harmful categories found in the scanned product or the ingredients the user should avoid.
+    Served from memory, so it is the answer while SerpAPI results are pending, over budget or failing.
+    """
+    curated = DATABASE.current.curated
+    with METRICS.span('curated_recommendations'):
         skin_type = user_profile.get('skinType', '') if user_profile else ''
-        if skin_type == 'dry':
-            search_terms.append('hydrating')
-            search_terms.append('for dry skin')
-        elif skin_type == 'oily':
-            search_terms.append('oil-free')
-            search_terms.append('for oily skin')
-        elif skin_type == 'combination':
-            search_terms.append('for combination skin')
-        elif skin_type == 'sensitive':
-            search_terms.append('gentle')
-            search_terms.append('for sensitive skin')
-        
-        # Add ingredients to look for
-        if user_profile:
-            recommendations = get_personalized_recommendations(user_profile)
-            if recommendations and recommendations.get('look_for_ingredients'):
-                for ingredient in recommendations['look_for_ingredients'][:2]:  # Limit to 2 ingredients
-                    search_terms.append(ingredient)
-        
-        # Build final search query
-        search_query = ' '.join(search_terms)
-        search_query += ' buy online purchase best alternatives'
-        
-        print(f"Searching for: {search_query}")
-        
-        url = "https://serpapi.com/search"
-        recommendations = []
-        
-        # 1. Get product info and images from Google Shopping
-        params_shopping = {
+        avoid = curated.avoided_categories(harmful_ingredients, avoid_ingredients)
+        return curated.recommend(current_product.get('title', ''), skin_type, avoid)
+
+def cached_product_recommendations(current_product, user_profile, harmful_ingredients=None):
+    """Product recommendations if they can be served right away (cached or curated), otherwise None"""
+    if not serpapi_configured():
+        return get_product_recommendations(current_product, user_profile, harmful_ingredients)
+    search_query = product_search_query(product_search_type(current_product), user_profile)
+    if ALTERNATIVES_CACHE.peek(search_query) is None:
+        if serpapi_degradation() == 'curated':
+            return curated_product_recommendations(current_product, user_profile, harmful_ingredients)
+        return None
+    return get_product_recommendations(current_product, user_profile, harmful_ingredients)
+
+def record_query(search_query):
+    with QUERY_POPULARITY_LOCK:
+        QUERY_POPULARITY[search_query] += 1
+        if len(QUERY_POPULARITY) > 10 * ALTERNATIVES_WARM_TOP:
+            # Keep the counter bounded: drop the long tail
+            top = QUERY_POPULARITY.most_common(ALTERNATIVES_WARM_TOP)
+            QUERY_POPULARITY.clear()
+            QUERY_POPULARITY.update(dict(top))
+
+def search_product_alternatives(search_query):
+    """
+    Look up alternatives for a search query on Google Shopping, then Google Search.
+    Raises if nothing was found, so failed lookups are not cached.
+    """
+    # Spend less of a low budget: drop image lookups first, then link lookups
+    degradation = serpapi_degradation()
+    if degradation == 'curated' or not SERPAPI_BUDGET.acquire():
+        raise BudgetExceeded('SerpAPI budget exhausted')
+
+    # Everything below shares one deadline; whatever finished in time is returned
+    deadline = time.monotonic() + RECOMMENDATIONS_DEADLINE
+
+    recommendations = []
+
+    # 1. Get product info and images from Google Shopping
+    params_shopping = {
+        "q": search_query,
+        "api_key": SERPAPI_KEY,
+        "engine": "google_shopping",
+        "num": 8,
+        "gl": "us",
+        "hl": "en"
+    }
+    with METRICS.span('serpapi_shopping'):
+        response = HTTP_CLIENT.get('serpapi', SERPAPI_URL, params=params_shopping, timeout=remaining_timeout(deadline, 10))
+    note_throttling(SERPAPI_BUDGET, response)
+
+    if response.status_code == 200:
+        data = response.json()
+        shopping_results = data.get('shopping_results', [])
+
+        # Only consider results up to the point where 4 of them already have an image or a link
+        candidates = []
+        usable = 0
+        for result in shopping_results:
+            if usable >= 4:
+                break
+            candidates.append(result)
+            if result.get('link', '') or result.get('thumbnail', '') or result.get('image', '') or result.get('image_url', ''):
+                usable += 1
+
+        # If no direct link from shopping results, search for it (all lookups in parallel)
+        link_lookups = {
+            index: (find_purchase_link, (result.get('title', 'Unknown Product'), remaining_timeout(deadline, 5)))
+            for index, result in enumerate(candidates) if not result.get('link', '')
+        } if degradation != 'no_links' else {}
+        found_links = gather_lookups(link_lookups, deadline)
+
+        for index, result in enumerate(candidates):
+            if len(recommendations) >= 4:
+                break
+
+            title = result.get('title', 'Unknown Product')
+            price = result.get('price', 'Price not available')
+            image = result.get('thumbnail', '') or result.get('image', '') or result.get('image_url', '')
+            rating = result.get('rating', 'No rating')
+            reviews = result.get('reviews', 'No reviews')
+            source = result.get('source', 'Unknown')
+
+            # Try to find a purchase link for this product
+            purchase_link = result.get('link', '')
+            if not purchase_link and index in found_links:
+                purchase_link, link_source = found_links[index]
+                if link_source:
+                    # Update source based on the found link
+                    source = link_source
+
+            # Only add if we have either an image or a link
+            if image or purchase_link:
+                recommendations.append({
+                    'title': title,
+                    'price': price,
+                    'image': image,
+                    'link': purchase_link,
+                    'rating': rating,
+                    'reviews': reviews,
+                    'source': source
+                })
+
+    # 2. If we still don't have 4 recommendations, fill with Google Search results
+    if len(recommendations) < 4 and deadline > time.monotonic() and SERPAPI_BUDGET.acquire():
+        params_search = {
             "q": search_query,
             "api_key": SERPAPI_KEY,
-            "engine": "google_shopping",
-            "num": 8,
+            "engine": "google",
+            "num": 15,
             "gl": "us",
             "hl": "en"
         }
-        response = requests.get(url, params=params_shopping, timeout=10)
-        
+        with METRICS.span('serpapi_search'):
+            response = HTTP_CLIENT.get('serpapi', SERPAPI_URL, params=params_search, timeout=remaining_timeout(deadline, 10))
+        note_throttling(SERPAPI_BUDGET, response)
         if response.status_code == 200:
             data = response.json()
-            shopping_results = data.get('shopping_results', [])
-            
-            for result in shopping_results:
-                if len(recommendations) >= 4:
+            organic_results = data.get('organic_results', [])
+            organic_recommendations = []
+            for result in organic_results:
+                if len(recommendations) + len(organic_recommendations) >= 4:
                     break
-                    
-                title = result.get('title', 'Unknown Product')
-                price = result.get('price', 'Price not available')
-                image = result.get('thumbnail', '') or result.get('image', '') or result.get('image_url', '')
-                rating = result.get('rating', 'No rating')
-                reviews = result.get('reviews', 'No reviews')
-                source = result.get('source', 'Unknown')
-                
-                # Try to find a purchase link for this product
-                purchase_link = result.get('link', '')
-                
-                # If no direct link from shopping results, search for it
-                if not purchase_link:
-                    try:
-                        # Search for the product on major retailers
-                        link_search_query = f'"{title}" site:amazon.com OR site:target.com OR site:walmart.com OR site:ulta.com OR site:sephora.com'
-                        params_link_search = {
-                            "q": link_search_query,
-                            "api_key": SERPAPI_KEY,
-                            "engine": "google",
-                            "num": 3,
-                            "gl": "us",
-                            "hl": "en"
-                        }
-                        link_response = requests.get(url, params=params_link_search, timeout=5)
-                        
-                        if link_response.status_code == 200:
-                            link_data = link_response.json()
-                            link_results = link_data.get('organic_results', [])
-                            
-                            for link_result in link_results:
-                                link_url = link_result.get('link', '')
-                                if any(domain in link_url for domain in ['amazon.com', 'target.com', 'walmart.com', 'ulta.com', 'sephora.com']):
-                                    purchase_link = link_url
-                                    # Update source based on the found link
-                                    if 'amazon.com' in link_url:
-                                        source = "Amazon"
-                                    elif 'target.com' in link_url:
-                                        source = "Target"
-                                    elif 'walmart.com' in link_url:
-                                        source = "Walmart"
-                                    elif 'ulta.com' in link_url:
-                                        source = "Ulta"
-                                    elif 'sephora.com' in link_url:
-                                        source = "Sephora"
-                                    break
-                    except:
-                        pass  # If link search fails, continue without link
-                
-                # Only add if we have either an image or a link
-                if image or purchase_link:
-                    recommendations.append({
+                title = result.get('title', '')
+                link = result.get('link', '')
+                snippet = result.get('snippet', '')
+                # Skip if no link or if it's a review/article
+                if not link or any(skip_word in title.lower() for skip_word in ['review', 'best', 'top', 'guide', 'article', 'blog']):
+                    continue
+                # Only include if it's a product page or has product keywords
+                is_product_page = any(domain in link for domain in [
+                    'amazon.com', 'target.com', 'walmart.com', 'ulta.com', 'sephora.com',
+                    'cvs.com', 'walgreens.com', 'riteaid.com', 'drugstore.com', 'beauty.com',
+                    'dermstore.com', 'skinstore.com', 'lovelyskin.com', 'skincare.com'
+                ])
+                has_product_keywords = any(keyword in title.lower() for keyword in [
+                    'cleanser', 'moisturizer', 'serum', 'cream', 'lotion', 'wash',
+                    'skincare', 'beauty', 'facial', 'face'
+                ])
+                if is_product_page or has_product_keywords:
+                    price = "Price varies"
+                    if '$' in snippet:
+                        price_match = re.search(r'\$\d+(?:\.\d{2})?', snippet)
+                        if price_match:
+                            price = price_match.group()
+                    rating = "No rating"
+                    if '⭐' in snippet or 'star' in snippet.lower():
+                        rating = "4.0+ stars"
+                    source = "Online Store"
+                    if 'amazon.com' in link:
+                        source = "Amazon"
+                    elif 'target.com' in link:
+                        source = "Target"
+                    elif 'walmart.com' in link:
+                        source = "Walmart"
+                    elif 'ulta.com' in link:
+                        source = "Ulta"
+                    elif 'sephora.com' in link:
+                        source = "Sephora"
+                    elif 'cvs.com' in link:
+                        source = "CVS"
+                    elif 'walgreens.com' in link:
+                        source = "Walgreens"
+                    elif 'dermstore.com' in link:
+                        source = "Dermstore"
+                    elif 'skinstore.com' in link:
+                        source = "SkinStore"
+
+                    organic_recommendations.append({
                         'title': title,
                         'price': price,
-                        'image': image,
-                        'link': purchase_link,
+                        'image': '',
+                        'link': link,
                         'rating': rating,
-                        'reviews': reviews,
+                        'reviews': 'Check reviews',
                         'source': source
                     })
-        
-        # 2. If we still don't have 4 recommendations, fill with Google Search results
-        if len(recommendations) < 4:
-            params_search = {
-                "q": search_query,
-                "api_key": SERPAPI_KEY,
-                "engine": "google",
-                "num": 15,
-                "gl": "us",
-                "hl": "en"
-            }
-            response = requests.get(url, params=params_search, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                organic_results = data.get('organic_results', [])
-                for result in organic_results:
-                    if len(recommendations) >= 4:
-                        break
-                    title = result.get('title', '')
-                    link = result.get('link', '')
-                    snippet = result.get('snippet', '')
-                    # Skip if no link or if it's a review/article
-                    if not link or any(skip_word in title.lower() for skip_word in ['review', 'best', 'top', 'guide', 'article', 'blog']):
-                        continue
-                    # Only include if it's a product page or has product keywords
-                    is_product_page = any(domain in link for domain in [
-                        'amazon.com', 'target.com', 'walmart.com', 'ulta.com', 'sephora.com', 
-                        'cvs.com', 'walgreens.com', 'riteaid.com', 'drugstore.com', 'beauty.com',
-                        'dermstore.com', 'skinstore.com', 'lovelyskin.com', 'skincare.com'
-                    ])
-                    has_product_keywords = any(keyword in title.lower() for keyword in [
-                        'cleanser', 'moisturizer', 'serum', 'cream', 'lotion', 'wash', 
-                        'skincare', 'beauty', 'facial', 'face'
-                    ])
-                    if is_product_page or has_product_keywords:
-                        price = "Price varies"
-                        if '$' in snippet:
-                            import re
-                            price_match = re.search(r'\$\d+(?:\.\d{2})?', snippet)
-                            if price_match:
-                                price = price_match.group()
-                        rating = "No rating"
-                        if '⭐' in snippet or 'star' in snippet.lower():
-                            rating = "4.0+ stars"
-                        source = "Online Store"
-                        if 'amazon.com' in link:
-                            source = "Amazon"
-                        elif 'target.com' in link:
-                            source = "Target"
-                        elif 'walmart.com' in link:
-                            source = "Walmart"
-                        elif 'ulta.com' in link:
-                            source = "Ulta"
-                        elif 'sephora.com' in link:
-                            source = "Sephora"
-                        elif 'cvs.com' in link:
-                            source = "CVS"
-                        elif 'walgreens.com' in link:
-                            source = "Walgreens"
-                        elif 'dermstore.com' in link:
-                            source = "Dermstore"
-                        elif 'skinstore.com' in link:
-                            source = "SkinStore"
-                        
-                        # Try to get an image for this product
-                        image = ''
-                        try:
-                            # Search for product images
-                            image_query = f"{title} product image"
-                            params_image = {
-                                "q": image_query,
-                                "api_key": SERPAPI_KEY,
-                                "engine": "google_images",
-                                "num": 1,
-                                "gl": "us",
-                                "hl": "en"
-                            }
-                            image_response = requests.get(url, params=params_image, timeout=5)
-                            if image_response.status_code == 200:
-                                image_data = image_response.json()
-                                image_results = image_data.get('images_results', [])
-                                if image_results:
-                                    image = image_results[0].get('original', '')
-                        except:
-                            pass  # If image search fails, continue without image
-                        
-                        recommendations.append({
-                            'title': title,
-                            'price': price,
-                            'image': image,
-                            'link': link,
-                            'rating': rating,
-                            'reviews': 'Check reviews',
-                            'source': source
-                        })
-        
-        print(f"Returning {len(recommendations)} product recommendations (with images if available)")
-        return recommendations[:4]
-    except Exception as e:
-        print(f"Error getting product recommendations: {e}")
-        return []
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({
+            # Try to get an image for each of these products (all lookups in parallel)
+            image_lookups = {
+                index: (find_product_image, (item['title'], remaining_timeout(deadline, 5)))
+                for index, item in enumerate(organic_recommendations)
+            } if degradation == 'full' else {}
+            found_images = gather_lookups(image_lookups, deadline)
+            for index, item in enumerate(organic_recommendations):
+                item['image'] = found_images.get(index, '')
+            recommendations.extend(organic_recommendations)
+
+    LOG.event('product_recommendations', query=search_query, found=len(recommendations), degradation=degradation)
+    if not recommendations:
+        raise LookupError(f'No product alternatives found for "{search_query}"')
+    return recommendations[:4]
+
+def database_ready():
+    return len(DATABASE.current.bad_ingredients) > 0
+
+def liveness_payload():
+    """The process is up and serving; restart it only if this stops answering"""
+    return {'status': 'alive'}
+
+def readiness_payload():
+    """
+    Whether this worker should get traffic: the ingredient database is loaded. Gemini is reported but not
+    required, basic recommendations stand in until it is ready. Returns (response body, status code).
+    """
+    ready = database_ready()
+    return {'ready': ready, 'database': 'ready' if ready else 'failed', 'gemini': GEMINI.status()}, 200 if ready else 503
+
+def health_payload():
+    return {
         'status': 'healthy',
-        'harmful_ingredients_loaded': len(BAD_INGREDIENTS) > 0
-    })
+        'ready': database_ready(),
+        'harmful_ingredients_loaded': database_ready(),
+        'database': DATABASE.status(),
+        'gemini': GEMINI.status(),
+        'upstream_budgets': {
+            'serpapi': dict(SERPAPI_BUDGET.status(), degradation=serpapi_degradation()),
+            'gemini': GEMINI_BUDGET.status()
+        }
+    }
 
-@app.route('/', methods=['GET'])
-def home():
-    return jsonify({
+def home_payload():
+    return {
         'message': ' DermaScan API Running',
-        'endpoints': ['/analyze (POST)', '/health'],
-        'harmful_ingredients_loaded': len(BAD_INGREDIENTS)
-    })
+        'endpoints': ['/analyze (POST)', '/analyze/batch (POST)', '/recommendations/<id>', '/health', '/health/live', '/health/ready', '/metrics'],
+        'harmful_ingredients_loaded': len(DATABASE.current.bad_ingredients)
+    }
 
-@app.route('/analyze', methods=['POST'])
-def analyze_product():
+def cache_metrics():
+    """Scrape-time samples for the caches, single-flight layers and product source circuit breakers"""
+    tokenizer = tokenize_ingredients.cache_info()
+    caches = {
+        'product': PRODUCT_CACHE.stats(),
+        'response': RESPONSE_CACHE.stats(),
+        'recommendation': RECOMMENDATION_CACHE.stats(),
+        'alternatives': ALTERNATIVES_CACHE.stats(),
+        'gemini_analysis': DEEP_ANALYZER.cache.stats(),
+        'curated': DATABASE.current.curated.stats(),
+        'classification': DATABASE.current.engine.classifications.stats(),
+        'tokenizer': {'hits': tokenizer.hits, 'misses': tokenizer.misses, 'entries': tokenizer.currsize}
+    }
+    for cache, stats in caches.items():
+        # Stale recommendations are served immediately, so they count as hits
+        yield 'cache_hits_total', {'cache': cache}, stats['hits'] + stats.get('stale_hits', 0)
+        yield 'cache_misses_total', {'cache': cache}, stats['misses']
+        yield 'cache_entries', {'cache': cache}, stats['entries']
+    yield 'recommendation_jobs_pending', {}, RECOMMENDATION_JOBS.stats()['pending']
+    flights = {
+        'response': RESPONSE_FLIGHT,
+        'product': PRODUCT_SOURCES.flight,
+        'gemini': RECOMMENDATION_CACHE.flight,
+        'gemini_analysis': DEEP_ANALYZER.cache.flight,
+        'alternatives': ALTERNATIVES_CACHE.flight,
+        'serpapi': SERPAPI_FLIGHT
+    }
+    for layer, flight in flights.items():
+        stats = flight.stats()
+        yield 'single_flight_calls_total', {'layer': layer}, stats['calls']
+        yield 'single_flight_coalesced_total', {'layer': layer}, stats['coalesced']
+    for budget in (SERPAPI_BUDGET, GEMINI_BUDGET):
+        remaining = budget.remaining_today()
+        if remaining is not None:
+            yield 'upstream_budget_remaining', {'upstream': budget.name}, remaining
+        for reason, count in budget.status()['denied'].items():
+            yield 'upstream_budget_denied_total', {'upstream': budget.name, 'reason': reason}, count
+    for source in PRODUCT_SOURCES.sources:
+        yield 'circuit_open', {'source': source.name}, 1 if source.breaker.state == 'open' else 0
+
+METRICS.collector(cache_metrics)
+
+def metrics_payload():
+    return METRICS.render()
+
+def reload_database_payload(token):
+    """Rebuild the ingredient database snapshot from disk; returns (response body, status code)"""
+    if not ADMIN_TOKEN:
+        return {'error': 'Not found'}, 404
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return {'error': 'Unauthorized'}, 401
+    if RELOAD_MASTER_PID:
+        # Reloading only this worker would leave the others on the old version
+        try:
+            os.kill(RELOAD_MASTER_PID, signal.SIGHUP)
+        except OSError as e:
+            return {'error': f'Could not signal the server master: {e}'}, 500
+        return {'reloading': True, 'database': DATABASE.status()}, 202
+    previous = DATABASE.current.version
+    try:
+        DATABASE.reload()
+    except (OSError, ValueError) as e:
+        return {'error': f'Reload failed, still serving version {previous}: {e}'}, 500
+    return {'reloaded': DATABASE.current.version != previous, 'database': DATABASE.status()}, 200
+
+def start_recommendation_job(product_info, user_profile, harmful_ingredients):
+    def resolve():
+        with METRICS.span('product_recommendations'):
+            return get_product_recommendations(product_info, user_profile, harmful_ingredients)
+    job_id = RECOMMENDATION_JOBS.submit(resolve)
+    return {'id': job_id, 'status': PENDING, 'url': f'/recommendations/{job_id}'}
+
+def recommendation_job_payload(job_id, wait=0):
+    """State of a recommendation job, optionally waiting for it; returns (response body, status code)"""
+    try:
+        wait = min(max(float(wait or 0), 0), RECOMMENDATION_WAIT_MAX)
+    except ValueError:
+        return {'error': '"wait" must be a number of seconds'}, 400
+    job = RECOMMENDATION_JOBS.wait(job_id, wait) if wait else RECOMMENDATION_JOBS.get(job_id)
+    if job is None:
+        return {'error': 'Unknown or expired recommendation job', 'id': job_id}, 404
+    return {'id': job['id'], 'status': job['status'], 'product_recommendations': job['result'] or []}, 200
+
+def recommendation_events(job_id):
+    """Server-sent events for a job: keep-alive comments while pending, then one event with the result"""
+    deadline = time.monotonic() + RECOMMENDATION_WAIT_MAX
+    while True:
+        body, status = recommendation_job_payload(job_id, min(5, max(0, deadline - time.monotonic())))
+        if status != 200:
+            yield f"event: error\ndata: {app.json.dumps(body, separators=(',', ':'))}\n\n"
+            return
+        if body['status'] != PENDING or time.monotonic() >= deadline:
+            yield f"event: recommendations\ndata: {app.json.dumps(body, separators=(',', ':'))}\n\n"
+            return
+        yield ": pending\n\n"
+
+def analyze_payload(data):
+    """Run a full /analyze request; returns (response body, status code). Shared by the WSGI and ASGI servers."""
     try:
-        data = request.get_json()
-        print("🛠 Received JSON:", data)
         barcode = data.get('barcode')
         ingredients_text = data.get('ingredients')
         user_profile = data.get('user_profile')  # New field for user profile
         product_info = None
+        job = None
 
-        if barcode and len(barcode) == 13 and barcode.startswith("0"):
-            barcode = barcode[1:]
-            print(f"🛠 Trimmed barcode to 12 digits: {barcode}")
+        if user_profile is not None and not isinstance(user_profile, dict):
+            return {'error': '"user_profile" must be an object'}, 400
 
         if barcode:
-            print(f" Scanning barcode: {barcode}")
-            
-            product_info = get_product_info_from_incibeauty(barcode)
-            print(f"PRODUCT INFO {product_info}")
-
-            if not product_info or not product_info.get('ingredients'):
-                print(" UPC failed or missing ingredients. Trying INCI...")
-                product_info = get_product_info_from_incibeauty(barcode)
+            with METRICS.span('product_lookup'):
+                product_info = PRODUCT_SOURCES.lookup(barcode)
 
             if not product_info:
-                return jsonify({
+                return {
                     'error': 'Sorry! We could not find your reuqested item, please try again later',
                     'barcode': barcode
-                }), 404
+                }, 404
 
             ingredients_text = product_info.get('ingredients', '')
 
         if not ingredients_text:
-            return jsonify({
+            return {
                 'error': 'No ingredients found to analyze',
                 'product_info': product_info
-            }), 400
+            }, 400
 
         ingredients_list = parse_ingredients(ingredients_text)
         
@@ -651,23 +1045,377 @@ def analyze_product():
             analysis = get_personalized_analysis(ingredients_list, user_profile)
             # Get product recommendations if we have product info
             if product_info:
-                product_recommendations = get_product_recommendations(product_info, user_profile, analysis.get('harmful_ingredients', {}))
+                harmful_ingredients = analysis.get('harmful_ingredients', {})
+                if data.get('wait_for_recommendations'):
+                    with METRICS.span('product_recommendations'):
+                        product_recommendations = get_product_recommendations(product_info, user_profile, harmful_ingredients)
+                else:
+                    product_recommendations = cached_product_recommendations(product_info, user_profile, harmful_ingredients)
+                if product_recommendations is None:
+                    # Not cached yet: answer now with the curated picks and enrich them with SerpAPI in the background
+                    job = start_recommendation_job(product_info, user_profile, harmful_ingredients)
+                    product_recommendations = curated_product_recommendations(
+                        product_info, user_profile, harmful_ingredients,
+                        (analysis.get('recommendations') or {}).get('avoid_ingredients')
+                    )
                 analysis['product_recommendations'] = product_recommendations
         else:
             analysis = analyze_ingredients(ingredients_list)
 
-        return jsonify({
+        if data.get('deep_analysis'):
+            analysis['ai_analysis'] = deep_analysis(ingredients_list, user_profile)
+
+        body = {
             'success': True,
             'analysis': analysis,
             'product_info': product_info,
             'ingredients_analyzed': ingredients_list
-        })
+        }
+        if job:
+            body['recommendations_job'] = job
+        return body, 200
 
     except Exception as e:
-        print(f" Error in /analyze: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        LOG.error('analyze_failed', error=str(e))
+        return {'error': 'Internal server error'}, 500
+
+def json_body(body):
+    """Serialize a response body exactly like Flask's jsonify outside debug mode"""
+    return (app.json.dumps(body, separators=(',', ':')) + '\n').encode('utf-8')
+
+def analyze_cache_key(data):
+    """Response cache key for an /analyze request, or None if the request cannot be cached"""
+    if not isinstance(data, dict):
+        return None
+    barcode = data.get('barcode')
+    ingredients_text = data.get('ingredients')
+    user_profile = data.get('user_profile')
+    if barcode:
+        if not isinstance(barcode, str):
+            return None
+        subject = 'barcode:' + normalize_barcode(barcode)
+    elif ingredients_text and isinstance(ingredients_text, str):
+        subject = 'ingredients:' + hashlib.sha256(ingredients_text.encode('utf-8')).hexdigest()
+    else:
+        return None
+
+    profile = None
+    ai_ready = False
+    if user_profile:
+        if not isinstance(user_profile, dict):
+            return None
+        # Raw values: scoring, AI and fallback recommendations each normalize them differently
+        profile = json.dumps([user_profile.get(field, '') for field in ('age', 'gender', 'skinType')])
+        # Answers given with basic recommendations while Gemini was starting are not reused once it is ready
+        ai_ready = GEMINI.state == READY
+    return (subject, profile, DATABASE.current.version, ai_ready, bool(data.get('deep_analysis')))
+
+def analyze_response(data, if_none_match=None, cache_control=None, client=None):
+    """
+    Serve an /analyze request through the rate limiter and the response cache.
+    Returns (serialized body, status code, headers); a matching If-None-Match gets an empty 304.
+    """
+    start = time.perf_counter()
+    with trace() as spans:
+        if rate_limited(client):
+            body = json_body({'error': 'Too many scans, please slow down'})
+            status, headers, cache = 429, {'Retry-After': str(SCAN_RATE_WINDOW)}, 'rate_limited'
+        else:
+            body, status, headers, cache = cached_analyze_response(data, if_none_match, cache_control)
+    elapsed = time.perf_counter() - start
+
+    METRICS.inc('requests_total', endpoint='/analyze', status=status, cache=cache)
+    METRICS.observe('request_seconds', elapsed, endpoint='/analyze')
+    LOG.event(
+        'analyze', status=status, cache=cache,
+        barcode=data.get('barcode') if isinstance(data, dict) else None,
+        duration_ms=round(elapsed * 1000, 1),
+        spans_ms={stage: round(seconds * 1000, 1) for stage, seconds in spans.items()}
+    )
+    return body, status, headers
+
+def cached_analyze_response(data, if_none_match, cache_control):
+    """analyze_response without the instrumentation; also returns the cache outcome"""
+    key = analyze_cache_key(data)
+    if key is None:
+        cache = 'uncacheable'
+    elif 'no-cache' in (cache_control or ''):
+        cache = 'bypass'
+    else:
+        cached = RESPONSE_CACHE.get(key)
+        if cached is not None:
+            body, etag = cached
+            headers = {'ETag': etag, 'Cache-Control': RESPONSE_CACHE_CONTROL}
+            if etag_matches(if_none_match, etag):
+                return b'', 304, headers, 'hit'
+            return body, 200, headers, 'hit'
+        cache = 'miss'
+
+    if key is not None:
+        # A request that waits for its recommendations must not join one that returns a pending job
+        flight_key = key + (bool(data.get('wait_for_recommendations')),)
+        body, status = RESPONSE_FLIGHT.do(flight_key, lambda: analyze_payload(data))
+    else:
+        body, status = analyze_payload(data)
+    # Responses still waiting on a recommendation job, or missing a requested deep analysis, are not reusable
+    transient = 'recommendations_job' in body or body.get('analysis', {}).get('ai_analysis', True) is None
+    body = json_body(body)
+    if key is None or status != 200 or transient:
+        return body, status, {}, cache
+
+    etag = RESPONSE_CACHE.set(key, body)
+    headers = {'ETag': etag, 'Cache-Control': RESPONSE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return b'', 304, headers, cache
+    return body, 200, headers, cache
+
+def unique_items(values):
+    """Strip and deduplicate batch items, keeping their first-seen order"""
+    seen = {}
+    for value in values or []:
+        if isinstance(value, str) and value.strip():
+            seen.setdefault(value.strip(), None)
+    return list(seen)
+
+def validate_batch(data):
+    """Returns an (error body, status) tuple for an invalid /analyze/batch request, otherwise None"""
+    if not isinstance(data, dict):
+        return {'error': 'Expected a JSON object with "barcodes" and/or "ingredients" arrays'}, 400
+    for field in ('barcodes', 'ingredients'):
+        if data.get(field) is not None and not isinstance(data.get(field), list):
+            return {'error': f'"{field}" must be an array'}, 400
+    if data.get('user_profile') is not None and not isinstance(data.get('user_profile'), dict):
+        return {'error': '"user_profile" must be an object'}, 400
+    count = len(unique_items(data.get('barcodes'))) + len(unique_items(data.get('ingredients')))
+    if count == 0:
+        return {'error': 'No barcodes or ingredients to analyze'}, 400
+    if count > BATCH_MAX_ITEMS:
+        return {'error': f'Too many items, the limit is {BATCH_MAX_ITEMS} per batch'}, 400
+    return None
+
+def batch_item_result(ingredients_list, user_profile, detection, engine):
+    if user_profile:
+        return get_personalized_analysis(ingredients_list, user_profile, detection, engine)
+    return analyze_ingredients(ingredients_list, detection, engine)
+
+def analyze_batch(data):
+    """
+    Analyze many barcodes and/or ingredient strings with one shared user profile.
+    Yields one result per unique item as soon as it is ready. Product alternatives
+    (SerpAPI) are not looked up for batch items.
+    """
+    user_profile = data.get('user_profile')
+    barcodes = unique_items(data.get('barcodes'))
+    texts = unique_items(data.get('ingredients'))
+    # The whole batch is scored against one database snapshot, even if a reload lands mid-stream
+    engine = DATABASE.current.engine
+
+    # Barcodes resolve concurrently in the background while the ingredient strings are analyzed
+    futures = {BATCH_EXECUTOR.submit(PRODUCT_SOURCES.lookup, barcode): barcode for barcode in barcodes}
+
+    try:
+        # Ingredient strings are known up front: run the matcher over all of them in one pass
+        ingredient_lists = [parse_ingredients(text) for text in texts]
+        for text, ingredients_list, detection in zip(texts, ingredient_lists, engine.detect_many(ingredient_lists)):
+            yield {
+                'ingredients': text,
+                'status': 200,
+                'analysis': batch_item_result(ingredients_list, user_profile, detection, engine),
+                'ingredients_analyzed': ingredients_list
+            }
+
+        for future in as_completed(futures):
+            barcode = futures[future]
+            try:
+                product_info = future.result()
+            except Exception as e:
+                LOG.error('batch_lookup_failed', barcode=barcode, error=str(e))
+                yield {'barcode': barcode, 'status': 500, 'error': 'Internal server error'}
+                continue
+
+            if not product_info:
+                yield {'barcode': barcode, 'status': 404, 'error': 'Product not found'}
+            elif not product_info.get('ingredients'):
+                yield {'barcode': barcode, 'status': 400, 'error': 'No ingredients found to analyze', 'product_info': product_info}
+            else:
+                ingredients_list = parse_ingredients(product_info['ingredients'])
+                yield {
+                    'barcode': barcode,
+                    'status': 200,
+                    'analysis': batch_item_result(ingredients_list, user_profile, None, engine),
+                    'product_info': product_info,
+                    'ingredients_analyzed': ingredients_list
+                }
+    finally:
+        # Stop pending lookups if the client went away
+        for future in futures:
+            future.cancel()
+
+def ndjson_lines(results):
+    for result in results:
+        METRICS.inc('batch_items_total', status=result['status'])
+        yield app.json.dumps(result, separators=(',', ':')) + '\n'
+
+@app.before_request
+def start_background_clients():
+    start_background_jobs()
+    # Heavy optional clients start initializing once the server takes requests, never at import
+    GEMINI.start()
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify(health_payload())
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    return jsonify(liveness_payload())
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    body, status = readiness_payload()
+    return jsonify(body), status
+
+@app.route('/', methods=['GET'])
+def home():
+    return jsonify(home_payload())
+
+@app.route('/analyze', methods=['POST'])
+def analyze_product():
+    body, status, headers = analyze_response(
+        request.get_json(silent=True),
+        request.headers.get('If-None-Match'),
+        request.headers.get('Cache-Control'),
+        request.remote_addr
+    )
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+@app.route('/admin/reload-database', methods=['POST'])
+def reload_database():
+    body, status = reload_database_payload(request.headers.get('X-Admin-Token'))
+    return jsonify(body), status
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics_payload(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/recommendations/<job_id>', methods=['GET'])
+def recommendation_job(job_id):
+    body, status = recommendation_job_payload(job_id, request.args.get('wait'))
+    return jsonify(body), status
+
+@app.route('/recommendations/<job_id>/events', methods=['GET'])
+def recommendation_job_events(job_id):
+    return Response(stream_with_context(recommendation_events(job_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_product_batch():
+    data = request.get_json(silent=True)
+    error = validate_batch(data)
+    if error:
+        return jsonify(error[0]), error[1]
+    # One JSON object per line, in completion order
+    return Response(stream_with_context(ndjson_lines(analyze_batch(data))), mimetype='application/x-ndjson')
+
+def warm_recommendation_cache():
+    """Precompute AI recommendations for every (age, gender, skinType) combination"""
+    if GEMINI.wait(timeout=60) is None:
+        LOG.event('recommendations_warmup_skipped', sample=True, reason='ai_unavailable', gemini=GEMINI.status())
+        return 0
+    profiles = [
+        {'age': age, 'gender': gender, 'skinType': skin_type}
+        for age in [''] + list(AGE_MULTIPLIERS)
+        for gender in [''] + PROFILE_GENDERS
+        for skin_type in [''] + SKIN_TYPES
+    ]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(get_personalized_recommendations, profiles))
+    LOG.event('recommendations_warmed', sample=True, profiles=len(profiles), cache=RECOMMENDATION_CACHE.stats())
+    return len(profiles)
+
+def warm_product_alternatives():
+    """Prefetch SerpAPI alternatives for every (product type, skin type) query and the most requested queries"""
+    if not serpapi_configured():
+        LOG.event('alternatives_warmup_skipped', sample=True, reason='serpapi_not_configured')
+        return 0
+    queries = {}
+    # Queries only depend on the skin type
+    profiles = [None] + [{'skinType': skin_type} for skin_type in SKIN_TYPES]
+    for product_type in PRODUCT_SEARCH_TYPES:
+        for profile in profiles:
+            queries.setdefault(product_search_query(product_type, profile), None)
+    with QUERY_POPULARITY_LOCK:
+        popular = [query for query, _ in QUERY_POPULARITY.most_common(ALTERNATIVES_WARM_TOP)]
+    for query in popular:
+        queries.setdefault(query, None)
+
+    def warm(query):
+        # Fresh entries cost nothing, stale ones refresh in the background, missing ones are fetched.
+        # Speculative lookups are only worth it while the SerpAPI budget is healthy.
+        if serpapi_degradation() != 'full':
+            return
+        try:
+            ALTERNATIVES_CACHE.get_or_compute(query, lambda: search_product_alternatives(query))
+        except Exception as e:
+            LOG.error('alternatives_warm_failed', query=query, error=str(e))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(warm, queries))
+    LOG.event('alternatives_warmed', sample=True, queries=len(queries), cache=ALTERNATIVES_CACHE.stats())
+    return len(queries)
+
+def alternatives_warm_loop(interval):
+    while True:
+        warm_product_alternatives()
+        time.sleep(interval)
+
+def classification_save_loop(interval):
+    while True:
+        time.sleep(interval)
+        DATABASE.save_classifications()
+
+BACKGROUND_JOBS_STARTED = False
+BACKGROUND_JOBS_LOCK = threading.Lock()
+
+def reset_background_jobs():
+    # Threads do not survive a fork: a forked server worker starts its own
+    global BACKGROUND_JOBS_STARTED, BACKGROUND_JOBS_LOCK
+    BACKGROUND_JOBS_STARTED = False
+    BACKGROUND_JOBS_LOCK = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_background_jobs)
+
+def start_background_jobs():
+    """Start the warm-ups and periodic jobs once per serving process (never in a pre-fork master)"""
+    global BACKGROUND_JOBS_STARTED
+    if BACKGROUND_JOBS_STARTED:
+        return
+    with BACKGROUND_JOBS_LOCK:
+        if BACKGROUND_JOBS_STARTED:
+            return
+        BACKGROUND_JOBS_STARTED = True
+    if WARM_RECOMMENDATIONS:
+        threading.Thread(target=warm_recommendation_cache, daemon=True).start()
+    if ALTERNATIVES_WARM_INTERVAL > 0:
+        threading.Thread(target=alternatives_warm_loop, args=(ALTERNATIVES_WARM_INTERVAL,), daemon=True).start()
+    if DATABASE.classification_file:
+        atexit.register(DATABASE.save_classifications)
+        if CLASSIFICATION_CACHE_SAVE_INTERVAL > 0:
+            threading.Thread(target=classification_save_loop, args=(CLASSIFICATION_CACHE_SAVE_INTERVAL,), daemon=True).start()
+
+@app.cli.command('warm-alternatives')
+def warm_alternatives_command():
+    """Prefetch SerpAPI product alternatives for popular queries (use with ALTERNATIVES_CACHE_DB to persist them)."""
+    warm_product_alternatives()
+
+@app.cli.command('warm-recommendations')
+def warm_recommendations_command():
+    """Precompute the Gemini recommendation cache (use with RECOMMENDATION_CACHE_DB to persist it)."""
+    warm_recommendation_cache()
 
 if __name__ == '__main__':
+    # Development server; run `python server.py` in production (pre-fork workers, see server.py)
     print("🧴 DermaScan Backend Starting...")
-    print(f"Loaded {len(BAD_INGREDIENTS)} harmful ingredient categories")
+    print(f"Loaded {len(DATABASE.current.bad_ingredients)} harmful ingredient categories (database version {DATABASE.current.version})")
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,44 @@
+"""
+ASGI entry point for the DermaScan API.
+
+Serves the Flask app (app.py) through a WSGI-to-ASGI adapter, so routes, CORS,
+HEAD handling and 404/405 responses all come from the one Flask routing table.
+The event loop holds the connections and feeds request bodies to the app as it
+reads them; each request's blocking work (INCI Beauty, Gemini, SerpAPI) runs on
+a bounded pool of worker threads, and streamed responses (/analyze/batch,
+recommendation events) are sent as the app produces them, with backpressure.
+
+Run with any ASGI server, e.g.:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+import app as dermascan
+
+# Maximum number of requests running in the Flask app at the same time; the rest wait on the loop
+MAX_IN_FLIGHT = int(os.environ.get('ASGI_MAX_IN_FLIGHT', 256))
+
+FLASK_APP = WSGIMiddleware(dermascan.app, workers=MAX_IN_FLIGHT)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Heavy optional clients and periodic jobs start once the server takes requests, never at import
+            dermascan.GEMINI.start()
+            dermascan.start_background_jobs()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            FLASK_APP.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    await FLASK_APP(scope, receive, send)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Offline bulk audit of a product catalog against the harmful ingredients database.
+
+Streams a CSV or JSONL catalog of ingredient lists, scores every product with
+the same parse_ingredients, scoring engine and score categories used by the
+API (without AI recommendations, so Gemini is never called), fans the work out
+over a process pool in chunks and writes results incrementally, so memory stays constant for catalogs of any size.
+
+Examples (from the backend directory):
+    python audit_catalog.py catalog.csv scored.jsonl
+    python audit_catalog.py catalog.jsonl scored.csv --id-field sku --workers 8
+    python audit_catalog.py catalog.csv scored.jsonl --age 18_32 --skin-type dry
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import app as dermascan
+
+CSV_FIELDS = ['id', 'score', 'score_category', 'safe', 'harmful_count', 'total_weightage', 'harmful_categories', 'error']
+
+
+def parse_json_row(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def read_catalog(path, input_format, id_field, ingredients_field):
+    """
+    Yield (product id, ingredients text) pairs one row at a time. The ingredients text is
+    None for a row that is not a JSON object, which is reported as an error for that row.
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if input_format == 'csv':
+            rows = csv.DictReader(f)
+        else:
+            rows = (parse_json_row(line) for line in f if line.strip())
+        for line_number, row in enumerate(rows, 1):
+            if not isinstance(row, dict):
+                yield str(line_number), None
+                continue
+            # Only a missing id falls back to the line number; 0 and "" are ids too
+            product_id = row.get(id_field)
+            yield str(line_number if product_id is None else product_id), row.get(ingredients_field) or ''
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def init_worker():
+    # Scoring is local: no Gemini client, and only errors from the API's log (on stderr)
+    dermascan.GEMINI.disable()
+    dermascan.LOG.sample_rate = 0
+    sys.stdout = sys.stderr
+
+
+def score_chunk(chunk, user_profile):
+    engine = dermascan.DATABASE.current.engine
+    results = []
+    for product_id, ingredients_text in chunk:
+        if ingredients_text is None:
+            results.append({'id': product_id, 'error': 'Row is not a JSON object'})
+            continue
+        if not isinstance(ingredients_text, str):
+            results.append({'id': product_id, 'error': 'Ingredients must be a string'})
+            continue
+        ingredients_list = dermascan.parse_ingredients(ingredients_text)
+        if not ingredients_list:
+            results.append({'id': product_id, 'error': 'No ingredients found to analyze'})
+            continue
+
+        detection = engine.detect(ingredients_list)
+        analysis = engine.analyze(ingredients_list, detection)
+        if user_profile:
+            # The API's personalized score without its recommendations, which are per profile
+            personalized_score = engine.personalized_score(detection, user_profile)
+            score = round(personalized_score)
+            score_category = dermascan.get_score_category(personalized_score)
+        else:
+            score = analysis['safety_score']
+            score_category = dermascan.get_score_category(score)
+
+        results.append({
+            'id': product_id,
+            'score': score,
+            'score_category': score_category,
+            'safe': analysis['safe'],
+            'harmful_count': analysis['harmful_count'],
+            'total_weightage': analysis['total_weightage'],
+            'harmful_ingredients': {
+                category: data['ingredients'] for category, data in analysis['harmful_ingredients'].items()
+            }
+        })
+    return results
+
+
+def write_results(out, output_format, writer, results):
+    for result in results:
+        if output_format == 'csv':
+            row = dict(result, harmful_categories=';'.join(result.get('harmful_ingredients', {})))
+            row.pop('harmful_ingredients', None)
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(result) + '\n')
+
+
+def audit(args, user_profile):
+    input_format = args.input_format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    output_format = args.output_format or ('csv' if args.output.endswith('.csv') else 'jsonl')
+    chunks = chunked(read_catalog(args.input, input_format, args.id_field, args.ingredients_field), args.chunk_size)
+
+    processed = 0
+    started = last_report = time.time()
+    with open(args.output, 'w', newline='', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+        writer = None
+        if output_format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+
+        # Keep a bounded window of chunks in flight and write them back in input order
+        in_flight = deque()
+        window = args.workers * 2
+        for chunk in chunks:
+            in_flight.append(executor.submit(score_chunk, chunk, user_profile))
+            while len(in_flight) >= window or (in_flight and in_flight[0].done()):
+                results = in_flight.popleft().result()
+                write_results(out, output_format, writer, results)
+                processed += len(results)
+
+                if time.time() - last_report >= args.progress_every:
+                    last_report = time.time()
+                    rate = processed / (last_report - started)
+                    print(f"{processed} products scored ({rate:.0f} products/sec)", file=sys.stderr)
+
+        while in_flight:
+            results = in_flight.popleft().result()
+            write_results(out, output_format, writer, results)
+            processed += len(results)
+
+    elapsed = time.time() - started
+    print(f"Done: {processed} products in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} products/sec) -> {args.output}",
+          file=sys.stderr)
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='catalog file (.csv or .jsonl)')
+    parser.add_argument('output', help='results file (.jsonl or .csv)')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='defaults to the input file extension')
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'], help='defaults to the output file extension')
+    parser.add_argument('--id-field', default='id', help='column/key holding the product id (default: id)')
+    parser.add_argument('--ingredients-field', default='ingredients', help='column/key holding the ingredient list')
+    parser.add_argument('--age', choices=list(dermascan.AGE_MULTIPLIERS), help='score for this age group')
+    parser.add_argument('--gender', choices=dermascan.PROFILE_GENDERS)
+    parser.add_argument('--skin-type', choices=dermascan.SKIN_TYPES, help='score for this skin type')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=500, help='products per task sent to a worker')
+    parser.add_argument('--progress-every', type=float, default=5, help='seconds between progress reports')
+    args = parser.parse_args()
+
+    user_profile = None
+    if args.age or args.gender or args.skin_type:
+        user_profile = {'age': args.age or '', 'gender': args.gender or '', 'skinType': args.skin_type or ''}
+
+    audit(args, user_profile)
+
+
+if __name__ == '__main__':
+    main()
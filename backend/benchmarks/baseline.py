@@ -0,0 +1,79 @@
+"""
+Stored benchmark baselines and regression checks shared by the benchmark scripts.
+
+Results are {case name: {'throughput': ops/s, 'p50': s, 'p95': s, 'p99': s}}.
+A case regresses when a latency percentile grows, or throughput drops, by more
+than the tolerance relative to the stored baseline. Baselines are machine
+specific: record one with --save-baseline on the machine that will compare.
+"""
+
+import json
+import os
+
+LATENCY_METRICS = ('p50', 'p95', 'p99')
+# Differences below this many seconds are timer noise, whatever the ratio
+MIN_LATENCY_DELTA = 2e-6
+
+
+def add_baseline_arguments(parser, default_path):
+    parser.add_argument('--baseline', default=default_path, help='baseline file to compare against (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown (default: 0.2 = 20%%)')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, wall_seconds):
+    """Throughput and latency percentiles for a list of per-operation durations (seconds)."""
+    latencies = sorted(latencies)
+    return {
+        'throughput': len(latencies) / wall_seconds if wall_seconds > 0 else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in LATENCY_METRICS:
+            before, after = reference.get(metric), current.get(metric)
+            if before and after and after > before * (1 + tolerance) and after - before > MIN_LATENCY_DELTA:
+                regressions.append(f"{name} {metric}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms (+{(after / before - 1) * 100:.0f}%)")
+        before, after = reference.get('throughput'), current.get('throughput')
+        if before and after is not None and after < before / (1 + tolerance):
+            regressions.append(f"{name} throughput: {before:.1f}/s -> {after:.1f}/s (-{(1 - after / before) * 100:.0f}%)")
+    return regressions
+
+
+def check_baseline(results, args):
+    """Save or compare against the baseline file; returns the process exit code."""
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        return 0
+    print(f"REGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for line in regressions:
+        print(f"  {line}")
+    return 1
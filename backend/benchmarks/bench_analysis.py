@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the analysis pipeline: parse_ingredients, analyze_ingredients,
+get_personalized_analysis and the curated product recommendations.
+
+Each case swaps a synthetic database snapshot (10^2 to 10^5 names) into the app
+and times single calls on ingredient lists of 5 to 200 names, reporting
+throughput and p50/p95/p99 latency. Parsing is measured cold (tokenizer cache
+cleared every round) next to the plain re.split parser the tokenizer replaced
+(parse_ingredients_split, no normalization or interning); analysis is measured
+both cold (classification cache cleared every round) and warm. AI
+recommendations are disabled so only local work is timed. Results can be stored as a baseline and later runs flag regressions.
+
+Run from the backend directory:
+    python benchmarks/bench_analysis.py --save-baseline
+    python benchmarks/bench_analysis.py                       # compare with the stored baseline
+    python benchmarks/bench_analysis.py --sizes 100 1000 --lengths 5 50
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as dermascan
+from baseline import add_baseline_arguments, check_baseline, summarize
+from bench_matcher import DATA_PATH, random_name, synthetic_database
+from ingredient_database import snapshot_from_data
+from ingredient_tokenizer import tokenize_ingredients
+from scoring_engine import SKIN_TYPES
+
+DATABASE_SIZES = [100, 1000, 10000, 100000]
+LIST_LENGTHS = [5, 20, 50, 200]
+PROFILE = {'age': '18_32', 'gender': 'female', 'skinType': 'dry'}
+CURATED_TITLES = ['Foaming Face Wash', 'Daily Moisturizer', 'Mineral Sunscreen SPF 50', 'Night Cream', 'Vitamin C Serum']
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_analysis.json')
+
+
+def synthetic_texts(all_names, length, count, rng):
+    """Ingredient list strings of `length` names, about 20% of them from the database."""
+    texts = []
+    for _ in range(count):
+        names = [rng.choice(all_names) if rng.random() < 0.2 else random_name(rng) for _ in range(length)]
+        texts.append(', '.join(names))
+    return texts
+
+
+def split_ingredients(ingredients_text):
+    """The parser before ingredient_tokenizer: split on separators, no normalization."""
+    return [i.strip().lower() for i in re.split(r'[,;.\n\u2022]', ingredients_text) if i.strip()]
+
+
+def time_calls(fn, inputs, rounds, before_round=None):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        if before_round:
+            before_round()
+        for value in inputs:
+            start = time.perf_counter()
+            fn(value)
+            latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run(sizes, lengths, products, rounds):
+    rng = random.Random(42)
+    with open(DATA_PATH, 'r') as f:
+        base = json.load(f)
+    with open(os.path.join(os.path.dirname(DATA_PATH), 'skincare_recommendations.json'), 'r') as f:
+        curated = json.load(f)
+
+    # Local work only: no Gemini calls and no sampled log lines in the timings
+    dermascan.GEMINI.disable()
+    dermascan.LOG.sample_rate = 0
+
+    results = {}
+    print(f"{'case':<48} {'ops/s':>10} {'p50 (us)':>10} {'p95 (us)':>10} {'p99 (us)':>10}")
+    for size in sizes:
+        database = synthetic_database(base, size, rng)
+        start = time.perf_counter()
+        dermascan.DATABASE.current = snapshot_from_data(database, curated)
+        print(f"# {size} names, snapshot built in {(time.perf_counter() - start) * 1000:.0f} ms")
+        all_names = [name for data in database.values() for name in data['ingredients']]
+
+        # Curated alternatives for a spread of product titles, skin types and flagged categories
+        categories = list(database)
+        queries = [
+            ({'title': rng.choice(CURATED_TITLES)}, {'skinType': rng.choice(SKIN_TYPES + [''])},
+             {category: {} for category in rng.sample(categories, min(len(categories), rng.randint(0, 3)))})
+            for _ in range(products)
+        ]
+        name = f"curated_product_recommendations/names={size}"
+        results[name] = time_calls(lambda query: dermascan.curated_product_recommendations(*query), queries, rounds)
+        print_result(name, results[name])
+
+        for length in lengths:
+            texts = synthetic_texts(all_names, length, products, rng)
+            lists = [dermascan.parse_ingredients(text) for text in texts]
+            cases = {
+                'parse_ingredients': time_calls(dermascan.parse_ingredients, texts, rounds, tokenize_ingredients.cache_clear),
+                'parse_ingredients_split': time_calls(split_ingredients, texts, rounds),
+                'analyze_ingredients_cold': time_calls(
+                    dermascan.analyze_ingredients, lists, rounds, dermascan.DATABASE.current.engine.classifications.clear
+                ),
+                'analyze_ingredients': time_calls(dermascan.analyze_ingredients, lists, rounds),
+                'get_personalized_analysis': time_calls(
+                    lambda ingredients_list: dermascan.get_personalized_analysis(ingredients_list, PROFILE), lists, rounds
+                ),
+            }
+            for function, result in cases.items():
+                name = f"{function}/names={size}/len={length}"
+                results[name] = result
+                print_result(name, result)
+    return results
+
+
+def print_result(name, result):
+    print(f"{name:<48} {result['throughput']:>10.0f} {result['p50'] * 1e6:>10.1f} "
+          f"{result['p95'] * 1e6:>10.1f} {result['p99'] * 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DATABASE_SIZES, help='database sizes (names)')
+    parser.add_argument('--lengths', type=int, nargs='+', default=LIST_LENGTHS, help='ingredient list lengths')
+    parser.add_argument('--products', type=int, default=50, help='distinct ingredient lists per case')
+    parser.add_argument('--rounds', type=int, default=10, help='passes over the ingredient lists per case')
+    add_baseline_arguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.lengths, args.products, args.rounds)
+    sys.exit(check_baseline(results, args))
+
+
+if __name__ == '__main__':
+    main()
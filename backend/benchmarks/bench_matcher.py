@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the harmful ingredient matcher.
+
+Compares the original nested-loop scan (every ingredient x every category x
+every name) with the compiled IngredientMatcher on synthetic databases of
+growing size, and reports the per-request latency of classifying one
+ingredient list.
+
+Run from the backend directory:
+    python benchmarks/bench_matcher.py
+"""
+
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingredient_matcher import IngredientMatcher
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'bad_ingredients.json')
+DATABASE_SIZES = [49, 500, 2000, 10000]
+INGREDIENTS_PER_PRODUCT = 30
+REPEAT = 20
+
+
+def legacy_classify(ingredients_list, bad_ingredients):
+    """The original triple nested loop, kept here as the reference implementation."""
+    assigned = {}
+    for ingredient in ingredients_list:
+        for category, data in bad_ingredients.items():
+            for bad in data['ingredients']:
+                if bad.lower() in ingredient and ingredient not in assigned:
+                    assigned[ingredient] = category
+    return assigned
+
+
+def compiled_classify(ingredients_list, matcher):
+    assigned = {}
+    for ingredient in ingredients_list:
+        if ingredient in assigned:
+            continue
+        category = matcher.classify(ingredient)
+        if category is not None:
+            assigned[ingredient] = category
+    return assigned
+
+
+def random_name(rng):
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))) for _ in range(rng.randint(1, 3))]
+    return ' '.join(words).title()
+
+
+def synthetic_database(base, size, rng):
+    """Grow the real database to `size` names by adding synthetic categories."""
+    database = {category: dict(data, ingredients=list(data['ingredients'])) for category, data in base.items()}
+    count = sum(len(data['ingredients']) for data in database.values())
+    category_index = 0
+    while count < size:
+        names = [random_name(rng) for _ in range(min(25, size - count))]
+        database[f"Synthetic category {category_index}"] = {
+            'description': 'Synthetic benchmark category',
+            'weightage': 1,
+            'severity': 'LOW',
+            'ingredients': names
+        }
+        count += len(names)
+        category_index += 1
+    return database
+
+
+def synthetic_product(database, rng):
+    """Mostly harmless names, with a few database names embedded."""
+    all_names = [bad.lower() for data in database.values() for bad in data['ingredients']]
+    product = []
+    for _ in range(INGREDIENTS_PER_PRODUCT):
+        if rng.random() < 0.2:
+            product.append(rng.choice(all_names))
+        else:
+            product.append(random_name(rng).lower())
+    return product
+
+
+def time_per_request(fn, products):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for product in products:
+            fn(product)
+    return (time.perf_counter() - start) / (REPEAT * len(products))
+
+
+def main():
+    rng = random.Random(42)
+    with open(DATA_PATH, 'r') as f:
+        base = json.load(f)
+
+    print(f"{'names':>8} {'build (ms)':>11} {'legacy (us)':>12} {'compiled (us)':>14} {'speedup':>8}")
+    for size in DATABASE_SIZES:
+        database = synthetic_database(base, size, rng)
+        products = [synthetic_product(database, rng) for _ in range(20)]
+
+        start = time.perf_counter()
+        matcher = IngredientMatcher(database)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for product in products:
+            assert legacy_classify(product, database) == compiled_classify(product, matcher)
+
+        legacy = time_per_request(lambda p: legacy_classify(p, database), products)
+        compiled = time_per_request(lambda p: compiled_classify(p, matcher), products)
+        print(f"{matcher.pattern_count:>8} {build_ms:>11.1f} {legacy * 1e6:>12.1f} {compiled * 1e6:>14.1f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Throughput scaling and memory of the pre-fork server (server.py) as workers are added.
+
+Writes a synthetic ingredient database of --names names (bench_matcher) to a
+temporary data directory, starts server.py on it with each --workers count and
+drives CPU-bound /analyze requests (unique ingredient strings, no upstream
+calls) from --clients client processes. Reports throughput, its speedup over
+the first worker count, and memory from /proc/<pid>/smaps_rollup after the
+load: PSS summed over the master and workers (what the machine pays for the
+whole server) and the average private memory of one worker (what each added
+worker costs). Linux only; the client processes share the machine, so leave
+cores for them.
+
+Run from the backend directory:
+    python benchmarks/bench_prefork.py
+    python benchmarks/bench_prefork.py --workers 1 2 4 8 --clients 8 --names 100000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from bench_matcher import DATA_PATH, random_name, synthetic_database
+
+LIST_LENGTH = 50
+
+
+def write_database(data_dir, names, rng):
+    with open(DATA_PATH, 'r') as f:
+        database = synthetic_database(json.load(f), names, rng)
+    with open(os.path.join(data_dir, 'bad_ingredients.json'), 'w') as f:
+        json.dump(database, f)
+    shutil.copy(os.path.join(os.path.dirname(DATA_PATH), 'skincare_recommendations.json'), data_dir)
+    return [name for data in database.values() for name in data['ingredients']]
+
+
+def start_server(port, workers, data_dir):
+    env = dict(os.environ, DERMASCAN_DATA_DIR=data_dir, LOG_SAMPLE_RATE='0')
+    process = subprocess.Popen(
+        [sys.executable, 'server.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+         '--max-requests', '0'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        if len(child_pids(process.pid)) == workers:
+            try:
+                requests.get(f'http://127.0.0.1:{port}/health/ready', timeout=1)
+                return process
+            except requests.RequestException:
+                pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+def child_pids(parent):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name may contain spaces; the parent pid follows its closing parenthesis
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == parent:
+                    pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields
+
+
+def client(args):
+    base_url, all_names, seed, stop_at = args
+    rng = random.Random(seed)
+    session = requests.Session()
+    done = errors = 0
+    while time.time() < stop_at:
+        # About 20% database names, the rest unique, so most tokens miss the caches
+        names = [rng.choice(all_names) if rng.random() < 0.2 else random_name(rng) for _ in range(LIST_LENGTH)]
+        try:
+            ok = session.post(f'{base_url}/analyze', json={'ingredients': ', '.join(names)}, timeout=30).status_code == 200
+        except requests.RequestException:
+            ok = False
+        done += ok
+        errors += not ok
+    return done, errors
+
+
+def run_load(base_url, all_names, clients, duration):
+    stop_at = time.time() + duration
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client, [(base_url, all_names, seed, stop_at) for seed in range(clients)])
+    return sum(done for done, _ in results) / duration, sum(errors for _, errors in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to compare')
+    parser.add_argument('--clients', type=int, default=4, help='client processes generating load')
+    parser.add_argument('--names', type=int, default=10000, help='synthetic database size (ingredient names)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per worker count')
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='dermascan-bench-')
+    try:
+        all_names = write_database(data_dir, args.names, random.Random(42))
+        print(f"{args.names} names, {args.clients} clients, {args.duration}s per run, {os.cpu_count()} cores")
+        print(f"{'workers':>7} {'req/s':>8} {'speedup':>8} {'errors':>7} {'total PSS (MB)':>15} {'private/worker (MB)':>20}")
+        first = None
+        for workers in args.workers:
+            process = start_server(args.port, workers, data_dir)
+            try:
+                throughput, errors = run_load(f'http://127.0.0.1:{args.port}', all_names, args.clients, args.duration)
+                pids = child_pids(process.pid)
+                usage = [memory_kb(pid) for pid in pids + [process.pid]]
+                total_pss = sum(fields.get('Pss', 0) for fields in usage) / 1024
+                private = [memory_kb(pid) for pid in pids]
+                per_worker = sum(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+                                 for fields in private) / len(private) / 1024
+            finally:
+                process.terminate()
+                process.wait(timeout=60)
+            first = first or throughput
+            print(f"{workers:>7} {throughput:>8.1f} {throughput / first:>7.2f}x {errors:>7} {total_pss:>15.1f} {per_worker:>20.1f}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+In-process fake Gemini model and a check run of the deadline-bounded JSON calls.
+
+FakeGeminiModel streams a scripted answer in chunks with a delay between them,
+the way the SDK's generate_content(stream=True) does. The scenarios cover well
+formed, fenced, chatty, truncated, schema-breaking, slow and hanging answers.
+Each one is run through gemini_calls.generate_json and through the app's
+recommendation path (which must fall back to the basic rules on time), and the
+run exits non-zero if any outcome or timing is off.
+
+Run from the backend directory:
+    python benchmarks/fake_gemini.py
+    python benchmarks/fake_gemini.py --deadline 0.5
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as dermascan
+from gemini_calls import DeadlineExceeded, generate_json
+
+RECOMMENDATIONS = {
+    'products': ['Fake Cleanser', 'Fake Cream'],
+    'tips': ['Wear sunscreen'],
+    'avoid_ingredients': ['fragrance'],
+    'look_for_ingredients': ['ceramides']
+}
+ANSWER = json.dumps(RECOMMENDATIONS, indent=2)
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Streams `text` in `chunk_size` pieces, sleeping `delay` seconds before each; `hang` never ends."""
+
+    def __init__(self, text, chunk_size=16, delay=0.0, hang=False):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.hang = hang
+        self.chunks_sent = 0
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        chunks = self._chunks()
+        return chunks if stream else FakeChunk(''.join(chunk.text for chunk in chunks))
+
+    def _chunks(self):
+        for start in range(0, len(self.text), self.chunk_size):
+            time.sleep(self.delay)
+            self.chunks_sent += 1
+            yield FakeChunk(self.text[start:start + self.chunk_size])
+        while self.hang:
+            time.sleep(self.delay or 0.05)
+            self.chunks_sent += 1
+            yield FakeChunk(' ')
+
+
+# name -> (model factory given the deadline, expected outcome: 'ok', 'invalid' or 'deadline')
+SCENARIOS = {
+    'plain': (lambda deadline: FakeGeminiModel(ANSWER), 'ok'),
+    'code fence': (lambda deadline: FakeGeminiModel(f"```json\n{ANSWER}\n```"), 'ok'),
+    'prose around': (lambda deadline: FakeGeminiModel(f"Sure! Here is the JSON {{as requested}}:\n{ANSWER}\nHope this helps."), 'ok'),
+    'braces in strings': (lambda deadline: FakeGeminiModel(json.dumps(dict(RECOMMENDATIONS, tips=['Use {SPF} "30+" daily }']), indent=2)), 'ok'),
+    # The object is complete early; the model keeps talking slowly and must not be waited for
+    'slow trailing prose': (lambda deadline: FakeGeminiModel(ANSWER + ' Note:' + ' more' * 200, chunk_size=64,
+                                                             delay=deadline / 20), 'ok'),
+    'truncated': (lambda deadline: FakeGeminiModel(ANSWER[:len(ANSWER) // 2]), 'invalid'),
+    'missing field': (lambda deadline: FakeGeminiModel(json.dumps({'products': [], 'tips': []})), 'invalid'),
+    'wrong type': (lambda deadline: FakeGeminiModel(json.dumps(dict(RECOMMENDATIONS, tips='Wear sunscreen'))), 'invalid'),
+    'not json': (lambda deadline: FakeGeminiModel("I'm sorry, I can't help with that."), 'invalid'),
+    'slow': (lambda deadline: FakeGeminiModel(ANSWER, chunk_size=8, delay=deadline / 4), 'deadline'),
+    'hang': (lambda deadline: FakeGeminiModel('{"products": [', hang=True), 'deadline'),
+}
+
+
+def run_call(model, deadline):
+    start = time.perf_counter()
+    try:
+        generate_json(model, 'prompt', dermascan.RECOMMENDATIONS_SCHEMA, deadline)
+        outcome = 'ok'
+    except DeadlineExceeded:
+        outcome = 'deadline'
+    except ValueError:
+        outcome = 'invalid'
+    return outcome, time.perf_counter() - start
+
+
+def run_fallback(model, deadline, profile):
+    """Time the app's recommendation path with `model` as Gemini; returns (AI answer used, seconds)"""
+    dermascan.GEMINI.set(model)
+    start = time.perf_counter()
+    recommendations = dermascan.get_personalized_recommendations(profile)
+    return recommendations.get('products') == ['Fake Cleanser', 'Fake Cream'], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deadline', type=float, default=1.0, help='seconds allowed per call')
+    parser.add_argument('--slack', type=float, default=0.25, help='allowed lateness past the deadline, in seconds')
+    args = parser.parse_args()
+
+    dermascan.LOG.sample_rate = 0
+    dermascan.GEMINI_DEADLINE = args.deadline
+    profile = {'age': '18_32', 'gender': 'female', 'skinType': 'dry'}
+
+    failures = 0
+    print(f"{'scenario':<22} {'expected':>9} {'outcome':>9} {'call (ms)':>10} {'app (ms)':>9} {'app answer':>11}")
+    for name, (factory, expected) in SCENARIOS.items():
+        outcome, seconds = run_call(factory(args.deadline), args.deadline)
+        # A profile per scenario, so no answer comes from the recommendation cache
+        used_ai, app_seconds = run_fallback(factory(args.deadline), args.deadline, dict(profile, gender=name))
+
+        ok = outcome == expected and used_ai == (expected == 'ok')
+        # Every call, and the app's fallback, must finish by the deadline (plus scheduling slack)
+        ok = ok and seconds <= args.deadline + args.slack and app_seconds <= args.deadline + args.slack
+        if name == 'slow trailing prose':
+            ok = ok and seconds < args.deadline / 2  # Returned once the object was complete
+        failures += not ok
+        print(f"{name:<22} {expected:>9} {outcome:>9} {seconds * 1000:>10.1f} {app_seconds * 1000:>9.1f} "
+              f"{'ai' if used_ai else 'fallback':>11}  {'ok' if ok else 'FAIL'}")
+
+    # Hanging calls are abandoned, not joined: give their workers a moment to notice and stop reading
+    time.sleep(args.deadline / 2)
+    print(f"{failures} failure(s); {threading.active_count()} threads alive")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
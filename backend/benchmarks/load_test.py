@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for /analyze: sync Flask server, the ASGI entry point and
+the pre-fork production server (server.py, --workers processes).
+
+Starts the stub upstreams (benchmarks/stub_upstreams.py) for INCI Beauty,
+SerpAPI and Gemini, launches each server mode as a subprocess pointed at them,
+then drives /analyze with concurrent clients and reports throughput and latency
+percentiles. Scenarios:
+    barcode-profile  unique barcodes with a user profile (INCI, Gemini and SerpAPI)
+    barcode          unique barcodes without a profile (INCI only)
+    ingredients      unique ingredient strings (no upstream calls)
+    deep-analysis    unique ingredient strings with a profile and "deep_analysis" (batched Gemini calls)
+Barcodes and ingredient strings never repeat, so the product and response caches
+never hit; Gemini answers are memoized per profile as in production.
+
+The ASGI mode needs an ASGI server installed (uvicorn). Run from the backend
+directory:
+    python benchmarks/load_test.py --concurrency 100 --duration 20
+    python benchmarks/load_test.py --scenarios barcode-profile ingredients --save-baseline
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from baseline import add_baseline_arguments, check_baseline, summarize
+from stub_upstreams import StubHandler, start_stub_upstreams
+
+# Every server process routes Gemini to the stub before serving (STUB_UPSTREAMS_URL)
+INSTALL_STUB_GEMINI = (
+    "import sys, os; sys.path.insert(0, 'benchmarks'); import app, stub_upstreams; "
+    "stub_upstreams.install_stub_gemini(app, os.environ['STUB_UPSTREAMS_URL']); "
+)
+
+SERVER_COMMANDS = {
+    # The development server app.py runs today (threaded, without the debugger/reloader)
+    'sync': lambda port, workers: [sys.executable, '-c', INSTALL_STUB_GEMINI +
+                          f"app.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    'asgi': lambda port, workers: [sys.executable, '-c', INSTALL_STUB_GEMINI +
+                          f"import asgi, uvicorn; uvicorn.run(asgi.application, host='127.0.0.1', port={port}, log_level='warning')"],
+    'prefork': lambda port, workers: [sys.executable, '-c', INSTALL_STUB_GEMINI +
+                                      "import server; sys.argv = ['server.py', '--host', '127.0.0.1', "
+                                      f"'--port', '{port}', '--workers', '{workers}']; server.main()"],
+}
+
+SCENARIOS = ['barcode-profile', 'barcode', 'ingredients', 'deep-analysis']
+PROFILE = {'age': '18_32', 'gender': 'female', 'skinType': 'dry'}
+INGREDIENT_NAMES = ['Aqua', 'Glycerin', 'Parfum', 'Methylparaben', 'Sodium Laureth Sulfate', 'Dimethicone',
+                    'Niacinamide', 'Tocopherol', 'Alcohol Denat', 'Citric Acid', 'Cetearyl Alcohol', 'Triclosan']
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baseline_load.json')
+
+# Shared by every run so no barcode or ingredient string is ever sent twice
+NUMBERS = itertools.count(3000000000000)
+NUMBER_LOCK = threading.Lock()
+
+
+def start_server(mode, port, upstream_url, workers):
+    env = dict(os.environ, INCI_BASE_URL=upstream_url, SERPAPI_URL=f'{upstream_url}/search',
+               STUB_UPSTREAMS_URL=upstream_url)
+    process = subprocess.Popen(SERVER_COMMANDS[mode](port, workers), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with code {process.returncode}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/health', timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def scenario_payload(scenario, number):
+    if scenario in ('ingredients', 'deep-analysis'):
+        # A unique ingredient string per request: a rotating selection plus a numbered filler
+        names = [INGREDIENT_NAMES[(number + i) % len(INGREDIENT_NAMES)] for i in range(8)] + [f'Extract {number}']
+        if scenario == 'deep-analysis':
+            return {'ingredients': ', '.join(names), 'user_profile': PROFILE, 'deep_analysis': True}
+        return {'ingredients': ', '.join(names)}
+    payload = {'barcode': str(number)}
+    if scenario == 'barcode-profile':
+        payload['user_profile'] = PROFILE
+    return payload
+
+
+def run_load(base_url, concurrency, duration, scenario):
+    latencies = []
+    errors = [0]
+    results_lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client():
+        session = requests.Session()
+        while time.time() < stop_at:
+            with NUMBER_LOCK:
+                payload = scenario_payload(scenario, next(NUMBERS))
+            start = time.perf_counter()
+            try:
+                ok = session.post(f'{base_url}/analyze', json=payload, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.time() - started
+
+    return dict(summarize(latencies, wall), requests=len(latencies), errors=errors[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'asgi'], choices=sorted(SERVER_COMMANDS))
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=15, help='seconds per mode')
+    parser.add_argument('--inci-latency', type=float, default=0.3)
+    parser.add_argument('--serpapi-latency', type=float, default=0.5)
+    parser.add_argument('--gemini-latency', type=float, default=1.0)
+    parser.add_argument('--scenarios', nargs='+', default=['barcode-profile'], choices=SCENARIOS)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes in prefork mode')
+    parser.add_argument('--json', help='also write the results to this file')
+    add_baseline_arguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args()
+
+    stub, upstream_url = start_stub_upstreams(0, args.inci_latency, args.serpapi_latency, args.gemini_latency)
+    print(f"Stub upstreams on {upstream_url} (INCI {args.inci_latency}s, SerpAPI {args.serpapi_latency}s, "
+          f"Gemini {args.gemini_latency}s), {args.concurrency} clients, {args.duration}s per run")
+    print(f"{'mode':>7} {'scenario':>16} {'ok':>7} {'errors':>7} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'upstream calls (inci/serpapi/gemini)':>37}")
+
+    results = {}
+    for mode in args.modes:
+        process = start_server(mode, args.port, upstream_url, args.workers)
+        try:
+            for scenario in args.scenarios:
+                StubHandler.counts = {'inci': 0, 'serpapi': 0, 'gemini': 0}
+                result = run_load(f'http://127.0.0.1:{args.port}', args.concurrency, args.duration, scenario)
+                results[f'{mode}/{scenario}'] = result
+                calls = '/'.join(str(StubHandler.counts[upstream]) for upstream in ('inci', 'serpapi', 'gemini'))
+                print(f"{mode:>7} {scenario:>16} {result['requests']:>7} {result['errors']:>7} {result['throughput']:>8.1f} "
+                      f"{result['p50'] * 1000:>9.0f} {result['p95'] * 1000:>9.0f} {result['p99'] * 1000:>9.0f} {calls:>37}")
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    stub.shutdown()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    sys.exit(check_baseline(results, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Local stand-ins for the INCI Beauty, SerpAPI and Gemini upstreams, with injected latency.
+
+Point the backend at them with:
+    INCI_BASE_URL=http://127.0.0.1:<port>
+    SERPAPI_URL=http://127.0.0.1:<port>/search
+and, in the server process, install_stub_gemini(app, 'http://127.0.0.1:<port>')
+to route Gemini calls to the stub's generateContent endpoint.
+
+Run standalone:
+    python benchmarks/stub_upstreams.py --port 8900 --inci-latency 0.3 --serpapi-latency 0.5 --gemini-latency 1.0
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+STUB_INGREDIENTS = [
+    'Aqua', 'Glycerin', 'Cetearyl Alcohol', 'Dimethicone', 'Phenoxyethanol',
+    'Methylparaben', 'Parfum', 'Sodium Laureth Sulfate', 'Tocopherol', 'Citric Acid'
+]
+
+STUB_RECOMMENDATIONS = {
+    'products': ['Stub Gentle Cleanser', 'Stub Barrier Cream', 'Stub Mineral SPF 30'],
+    'tips': ['Patch test new products', 'Moisturize twice a day', 'Wear sunscreen daily'],
+    'avoid_ingredients': ['fragrance', 'alcohol denat'],
+    'look_for_ingredients': ['ceramides', 'niacinamide']
+}
+
+STUB_ANALYSIS = {
+    'safety_score': 72,
+    'score_category': 'Fair',
+    'harmful_ingredients': {'parfum': {'severity': 'LOW', 'reason': 'Fragrance allergen', 'severity_score': -5,
+                                       'alternatives': 'Fragrance-free formulas'}},
+    'recommendations': STUB_RECOMMENDATIONS,
+    'analysis_summary': 'Stub analysis.'
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = {'inci': 0.0, 'serpapi': 0.0, 'gemini': 0.0}
+    counts = {'inci': 0, 'serpapi': 0, 'gemini': 0}
+    counts_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/product/composition/'):
+            self._count('inci')
+            ean = url.path.split('/')[3]
+            body = {
+                'name': f'Stub Moisturizer {ean}',
+                'brand': 'Stub Brand',
+                'compositions': [{'ingredients': [{'name': name} for name in STUB_INGREDIENTS]}],
+                'images': {'image': None}
+            }
+            time.sleep(self.latency['inci'])
+            self._send(200, body)
+        elif url.path == '/search':
+            self._count('serpapi')
+            engine = parse_qs(url.query).get('engine', [''])[0]
+            time.sleep(self.latency['serpapi'])
+            self._send(200, self._serpapi_body(engine))
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        # Gemini REST API: POST /v1beta/models/<model>:generateContent
+        url = urlparse(self.path)
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if url.path.endswith(':generateContent'):
+            self._count('gemini')
+            time.sleep(self.latency['gemini'])
+            prompt = request.get('contents', [{}])[0].get('parts', [{}])[0].get('text', '')
+            product_ids = re.findall(r'^- id (\w+) ', prompt, re.MULTILINE)
+            if product_ids:
+                # Batched ingredient analysis: one result per product id
+                answer = {'results': [dict(STUB_ANALYSIS, id=product_id) for product_id in product_ids]}
+            else:
+                answer = STUB_RECOMMENDATIONS
+            self._send(200, {'candidates': [{'content': {'parts': [{'text': json.dumps(answer)}]}}]})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    @staticmethod
+    def _serpapi_body(engine):
+        if engine == 'google_shopping':
+            return {'shopping_results': [
+                {'title': f'Stub Product {i}', 'price': '$10.00', 'thumbnail': f'https://img.example/{i}.jpg',
+                 'link': f'https://www.ulta.com/p/{i}', 'source': 'Ulta'}
+                for i in range(8)
+            ]}
+        if engine == 'google_images':
+            return {'images_results': [{'original': 'https://img.example/stub.jpg'}]}
+        return {'organic_results': [
+            {'title': f'Stub Face Cream {i}', 'link': f'https://www.target.com/p/{i}', 'snippet': '$12.99'}
+            for i in range(5)
+        ]}
+
+    def _count(self, upstream):
+        with self.counts_lock:
+            self.counts[upstream] += 1
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGeminiModel:
+    """Drop-in for genai.GenerativeModel that calls the stub's generateContent endpoint."""
+
+    def __init__(self, base_url, model_name='gemini-1.5-flash'):
+        self.url = f'{base_url}/v1beta/models/{model_name}:generateContent'
+        self.session = requests.Session()
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        timeout = (request_options or {}).get('timeout', 60)
+        response = self.session.post(self.url, json={'contents': [{'parts': [{'text': prompt}]}]}, timeout=timeout)
+        response.raise_for_status()
+        text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        if stream:
+            # Like the SDK: an iterable of partial responses
+            return [StubGeminiResponse(text[start:start + 256]) for start in range(0, len(text), 256)]
+        return StubGeminiResponse(text)
+
+
+def install_stub_gemini(app_module, base_url):
+    """Point an imported backend `app` module at the stub Gemini endpoint."""
+    app_module.GEMINI.set(StubGeminiModel(base_url))
+
+
+def start_stub_upstreams(port=0, inci_latency=0.0, serpapi_latency=0.0, gemini_latency=0.0):
+    """Start the stub server in a background thread; returns (server, base_url)."""
+    StubHandler.latency = {'inci': inci_latency, 'serpapi': serpapi_latency, 'gemini': gemini_latency}
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--inci-latency', type=float, default=0.3)
+    parser.add_argument('--serpapi-latency', type=float, default=0.5)
+    parser.add_argument('--gemini-latency', type=float, default=1.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_upstreams(args.port, args.inci_latency, args.serpapi_latency, args.gemini_latency)
+    print(f"Stub upstreams listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
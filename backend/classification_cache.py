@@ -0,0 +1,132 @@
+"""
+Cross-request memo of ingredient token -> harmful category index.
+
+The same few thousand tokens ("aqua", "glycerin", "phenoxyethanol", ...) make
+up nearly every ingredient list, so after warm-up most tokens are answered by
+one dict lookup instead of a pass through the matcher. Each ScoringEngine (and
+so each database snapshot version) has its own cache, which keeps answers
+from ever outliving the database they came from. Keys are interned, and every
+entry counts its hits. When the cache is full, the least used half is dropped
+and the remaining counts are halved, so the cache keeps the tokens that are
+currently common.
+
+The most frequent tokens can be saved to a JSON file and preloaded at startup.
+They are also carried over to a reloaded snapshot. A file saved under the same
+database version is used as is; under any other version the tokens are
+classified again. Hit counts are updated without a lock, so the statistics
+are approximate under concurrency.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+CLASSIFICATION_CACHE_SIZE = int(os.environ.get('CLASSIFICATION_CACHE_SIZE', 20000))
+
+
+class ClassificationCache:
+    def __init__(self, matcher, max_entries: int = CLASSIFICATION_CACHE_SIZE):
+        self.matcher = matcher
+        self.max_entries = max_entries
+        # token -> [category index or -1, hits]
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prunes = 0
+        self.preloaded = 0
+
+    def classify_index(self, ingredient: str) -> int:
+        """Category index for a normalized token, or -1; classified through the matcher once."""
+        entry = self._entries.get(ingredient)
+        if entry is not None:
+            entry[1] += 1
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        index = self.matcher.classify_index(ingredient)
+        self._store(ingredient, index, 1)
+        return index
+
+    def _store(self, ingredient: str, index: int, hits: int):
+        if self.max_entries <= 0:
+            return
+        if len(self._entries) >= self.max_entries:
+            self._prune()
+        self._entries[sys.intern(ingredient)] = [index, hits]
+
+    def _prune(self):
+        # Readers keep using the old dict until the new one is swapped in
+        with self._lock:
+            if len(self._entries) < self.max_entries:
+                return
+            keep = sorted(self._entries.items(), key=lambda item: item[1][1], reverse=True)[:self.max_entries // 2]
+            self._entries = {ingredient: [index, hits // 2] for ingredient, (index, hits) in keep}
+            self.prunes += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def most_frequent(self, count: int) -> List[str]:
+        entries = list(self._entries.items())
+        entries.sort(key=lambda item: item[1][1], reverse=True)
+        return [ingredient for ingredient, _ in entries[:count]]
+
+    def preload(self, ingredients: Iterable[str]) -> int:
+        """Classify `ingredients` ahead of traffic; returns how many were added."""
+        added = 0
+        for ingredient in ingredients:
+            if ingredient not in self._entries:
+                self._store(ingredient, self.matcher.classify_index(ingredient), 0)
+                added += 1
+        self.preloaded += added
+        return added
+
+    def save(self, path: str, version: str, count: Optional[int] = None) -> int:
+        """Write the `count` most frequent tokens (all by default) with their answers for `version`."""
+        entries = list(self._entries.items())
+        entries.sort(key=lambda item: item[1][1], reverse=True)
+        if count is not None:
+            entries = entries[:count]
+        data = {
+            'version': version,
+            'saved_at': time.time(),
+            'entries': [[ingredient, index, hits] for ingredient, (index, hits) in entries]
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return len(entries)
+
+    def load(self, path: str, version: str) -> int:
+        """Preload from a saved file; answers are reused only if it was saved for `version`."""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        entries = data.get('entries', [])[:self.max_entries]
+        if data.get('version') != version:
+            return self.preload(ingredient for ingredient, _, _ in entries)
+        added = 0
+        for ingredient, index, hits in entries:
+            if ingredient not in self._entries:
+                if not -1 <= index < len(self.matcher.categories):
+                    index = self.matcher.classify_index(ingredient)
+                self._store(ingredient, index, hits)
+                added += 1
+        self.preloaded += added
+        return added
+
+    def stats(self) -> Dict:
+        hits, misses = self.hits, self.misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'prunes': self.prunes,
+            'preloaded': self.preloaded
+        }
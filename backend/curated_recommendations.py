@@ -0,0 +1,126 @@
+"""
+Local product recommendations from skincare_recommendations.json.
+
+The curated lists (skin type -> product category -> products) are indexed once
+per database snapshot. A product is either a name or an object with a "name"
+and optionally its "ingredients" (an INCI list string) plus the usual result
+fields (price, image, link, ...). Products with ingredients are run through the
+harmful-ingredient matcher at build time, so a query only filters precomputed
+category sets: recommend() answers from memory in microseconds and keeps working
+when SerpAPI is slow, over budget or down.
+"""
+import threading
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from ingredient_tokenizer import normalize_name, tokenize_ingredients
+
+# Title keywords -> category, checked in order (a "cleansing cream" is a cleanser)
+CATEGORY_KEYWORDS = [
+    ('cleanser', ('cleanser', 'cleansing', 'wash', 'foam')),
+    ('sunscreen', ('sunscreen', 'spf', 'sun ')),
+    ('moisturizer', ('moisturizer', 'moisturising', 'moisturizing', 'cream', 'lotion')),
+]
+DEFAULT_CATEGORY = 'moisturizer'
+DEFAULT_SKIN_TYPE = 'sensitive'  # Gentlest picks when the skin type is unknown
+MAX_RESULTS = 4
+QUERY_CACHE_SIZE = 4096
+
+
+class CuratedProduct(NamedTuple):
+    result: Dict  # Shaped like a SerpAPI product recommendation
+    categories: Optional[FrozenSet[str]]  # Harmful categories found; None when the ingredients are unknown
+
+
+def infer_category(title: str) -> str:
+    """The curated product category for a scanned product title"""
+    title = (title or '').lower() + ' '
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in title for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+
+class CuratedRecommender:
+    def __init__(self, recommendations: Dict[str, Dict], engine):
+        """Index the curated lists, classifying every product with known ingredients through `engine`."""
+        self.engine = engine
+        self.index: Dict[tuple, List[CuratedProduct]] = {}
+        for skin_type, by_category in recommendations.items():
+            if not isinstance(by_category, dict):
+                continue
+            for category, products in by_category.items():
+                self.index[(skin_type, category)] = [self._build_product(product) for product in products]
+        self.skin_types = frozenset(skin_type for skin_type, _ in self.index)
+
+        # (skin type, category, avoided categories) -> results; the index never changes, so neither do they
+        self._queries: Dict[tuple, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _build_product(self, product) -> CuratedProduct:
+        if isinstance(product, str):
+            product = {'name': product}
+        result = {
+            'title': product['name'],
+            'price': product.get('price', 'Price varies'),
+            'image': product.get('image', ''),
+            'link': product.get('link', ''),
+            'rating': product.get('rating', 'No rating'),
+            'reviews': product.get('reviews', 'Check reviews'),
+            'source': product.get('source', 'DermaScan picks')
+        }
+        categories = None
+        if product.get('ingredients'):
+            detection = self.engine.detect(list(tokenize_ingredients(product['ingredients'])))
+            categories = frozenset(detection.harmful_found)
+        return CuratedProduct(result, categories)
+
+    def avoided_categories(self, harmful_ingredients: Optional[Dict] = None,
+                           avoid_ingredients: Optional[Iterable[str]] = None) -> FrozenSet[str]:
+        """Categories to exclude: those flagged in the scanned product plus those of the names to avoid"""
+        avoided = set(harmful_ingredients or ())
+        for name in avoid_ingredients or ():
+            if not isinstance(name, str):
+                continue  # AI recommendations are not schema-checked
+            index = self.engine.matcher.classify_index(normalize_name(name))
+            if index != -1:
+                avoided.add(self.engine.categories[index])
+        return frozenset(avoided)
+
+    def recommend(self, title: str, skin_type: str = '', avoid: FrozenSet[str] = frozenset()) -> List[Dict]:
+        """
+        Curated alternatives for a product: same category, the user's skin type, none of the avoided
+        categories. Products verified clean come first, then those with unknown ingredients.
+        """
+        key = (skin_type if skin_type in self.skin_types else DEFAULT_SKIN_TYPE, infer_category(title), avoid)
+        results = self._queries.get(key)
+        if results is None:
+            results = self._query(*key)
+            with self._lock:
+                self.misses += 1
+                if len(self._queries) >= QUERY_CACHE_SIZE:
+                    self._queries.clear()
+                self._queries[key] = results
+        else:
+            with self._lock:
+                self.hits += 1
+        return [dict(result) for result in results]
+
+    def _query(self, skin_type: str, category: str, avoid: FrozenSet[str]) -> List[Dict]:
+        candidates = self.index.get((skin_type, category)) or self.index.get((skin_type, DEFAULT_CATEGORY), [])
+        ranked = []
+        for position, product in enumerate(candidates):
+            if product.categories is None:
+                rank = 1
+            elif product.categories & avoid:
+                continue
+            else:
+                rank = 0 if not product.categories else 2
+            ranked.append((rank, position, product.result))
+        ranked.sort(key=lambda item: item[:2])
+        return [result for _, _, result in ranked[:MAX_RESULTS]]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._queries)}
@@ -1,32 +1,62 @@
-import google.generativeai as genai
+"""
+Gemini deep ingredient analysis, cached and micro-batched.
+
+Results are cached by a hash of the sorted, normalized ingredient set plus the
+(age, gender, skinType) profile key, so the same formula is analyzed once for
+each profile whatever the ingredient order or spelling variants. Cache misses
+go through a MicroBatcher: requests arriving within `max_wait` seconds of each
+other are packed (up to `max_batch_size`) into one multi-product prompt that
+asks for a JSON result per product id. Prompt and response sizes are recorded
+for every model call. Calls are streamed under a deadline and each product's
+result is schema-checked (gemini_calls).
+"""
+import hashlib
 import json
-from typing import Dict, List, Optional, Any
+import time
+from typing import Any, Callable, Dict, List, Optional
 
-# Type hints to help linter understand the module
-configure = genai.configure  # type: ignore
-GenerativeModel = genai.GenerativeModel  # type: ignore
+from gemini_calls import generate_json, validate
+from ingredient_tokenizer import normalize_name
+from memo_cache import MemoCache
+from micro_batcher import MicroBatcher
 
-class GeminiAnalyzer:
-    def __init__(self, api_key: str):
-        """Initialize Gemini AI with manually provided API key."""
-        if not api_key:
-            raise ValueError("Gemini API key must be provided.")
-        configure(api_key=api_key)
-        self.model = GenerativeModel("gemini-1.5-flash")
+PROFILE_FIELDS = ('age', 'gender', 'skinType')
 
-    def analyze_ingredients(self, ingredients_list: List[str], user_profile: Optional[Dict] = None) -> Dict[str, Any]:
-        """Use Gemini to analyze ingredients and return a safety score, insights, and recommendations."""
-        profile_context = ""
-        if user_profile:
-            profile_context = f"""
-User Profile:
-- Age Group: {user_profile.get('age', '').replace('_', '-') or 'Unknown'}
-- Gender: {user_profile.get('gender', '') or 'Unknown'}
-- Skin Type: {user_profile.get('skinType', '') or 'Unknown'}
-"""
+ANALYSIS_SCHEMA = {
+    'safety_score': (int, float),
+    'score_category': str,
+    'harmful_ingredients': dict,
+    'recommendations': {'products': [str], 'tips': [str], 'avoid_ingredients': [str], 'look_for_ingredients': [str]},
+    'analysis_summary': str
+}
+BATCH_SCHEMA = {'results': [dict]}
+
+
+def profile_key(user_profile: Optional[Dict]) -> tuple:
+    return tuple(str((user_profile or {}).get(field) or '').strip().lower() for field in PROFILE_FIELDS)
+
+
+def analysis_key(ingredients_list: List[str], user_profile: Optional[Dict]) -> str:
+    """Cache key: the normalized ingredient set (order and duplicates ignored) plus the profile key"""
+    ingredients = sorted({normalize_name(ingredient) for ingredient in ingredients_list if ingredient})
+    digest = hashlib.sha256(json.dumps(ingredients).encode('utf-8')).hexdigest()
+    return f"{digest}:{':'.join(profile_key(user_profile))}"
+
+
+def describe_profile(user_profile: Optional[Dict]) -> str:
+    age, gender, skin_type = profile_key(user_profile)
+    return f"Age Group: {age.replace('_', '-') or 'Unknown'}; Gender: {gender or 'Unknown'}; Skin Type: {skin_type or 'Unknown'}"
 
-        prompt = f"""
-You are a certified dermatologist and skincare expert. Analyze the following skincare ingredients.
+
+def build_prompt(items: List[Dict]) -> str:
+    """One prompt for several products; each item is {'id', 'ingredients', 'user_profile'}"""
+    products = "\n".join(
+        f"- id {item['id']} ({describe_profile(item['user_profile'])}): {', '.join(item['ingredients'])}"
+        for item in items
+    )
+    return f"""
+You are a certified dermatologist and skincare expert. Analyze the skincare ingredients of each product below
+for the user profile given with it.
 
 Use this severity scale:
 - CRITICAL (-30 to -40): Carcinogens, hormone disruptors
@@ -35,38 +65,110 @@ Use this severity scale:
 - LOW (-3 to -10): Fragrances, synthetic fillers
 - SAFE (0): Generally safe
 
-{profile_context}
-
-Ingredients to analyze:
-{", ".join(ingredients_list)}
+Products:
+{products}
 
-Respond only in this exact JSON format:
+Respond only in this exact JSON format, with one entry in "results" per product id:
 {{
-  "safety_score": 85,
-  "score_category": "Good",
-  "harmful_ingredients": {{
-    "ingredient_name": {{
-      "severity": "HIGH",
-      "reason": "Known allergen",
-      "severity_score": -25,
-      "alternatives": "Use gentler preservatives"
+  "results": [
+    {{
+      "id": "p0",
+      "safety_score": 85,
+      "score_category": "Good",
+      "harmful_ingredients": {{
+        "ingredient_name": {{
+          "severity": "HIGH",
+          "reason": "Known allergen",
+          "severity_score": -25,
+          "alternatives": "Use gentler preservatives"
+        }}
+      }},
+      "recommendations": {{
+        "products": ["Product 1", "Product 2"],
+        "tips": ["Tip 1", "Tip 2"],
+        "avoid_ingredients": ["paraben"],
+        "look_for_ingredients": ["niacinamide", "ceramides"]
+      }},
+      "analysis_summary": "Summary of the product's safety profile."
     }}
-  }},
-  "recommendations": {{
-    "products": ["Product 1", "Product 2"],
-    "tips": ["Tip 1", "Tip 2"],
-    "avoid_ingredients": ["paraben"],
-    "look_for_ingredients": ["niacinamide", "ceramides"]
-  }},
-  "analysis_summary": "Summary of the product's safety profile."
+  ]
 }}
 """
 
+
+class GeminiAnalyzer:
+    def __init__(self, get_model: Callable[[], Any], cache: Optional[MemoCache] = None,
+                 max_batch_size: int = 8, max_wait: float = 0.05, timeout: float = 30,
+                 budget=None, metrics=None, log=None):
+        """
+        `get_model` returns the Gemini model, or None while it is not available. `budget` (an
+        UpstreamBudget) is charged once per model call, not per product.
+        """
+        self.get_model = get_model
+        self.cache = cache if cache is not None else MemoCache(ttl=24 * 3600, max_entries=4096, table='analysis', log=log)
+        self.timeout = timeout
+        self.budget = budget
+        self.metrics = metrics
+        self.log = log
+        self.batcher = MicroBatcher(self._analyze_batch, max_batch_size=max_batch_size, max_wait=max_wait,
+                                    name='gemini-analysis')
+        if metrics is not None:
+            metrics.describe('gemini_calls_total', 'counter', 'Gemini model calls by purpose')
+            metrics.describe('gemini_items_total', 'counter', 'Products analyzed by Gemini, summed over batched calls')
+            metrics.describe('gemini_prompt_bytes_total', 'counter', 'Bytes of prompt sent to Gemini')
+            metrics.describe('gemini_response_bytes_total', 'counter', 'Bytes of response received from Gemini')
+
+    def analyze_ingredients(self, ingredients_list: List[str], user_profile: Optional[Dict] = None) -> Dict[str, Any]:
+        """Use Gemini to analyze ingredients and return a safety score, insights, and recommendations."""
+        key = analysis_key(ingredients_list, user_profile)
+        item = {'key': key, 'ingredients': list(ingredients_list), 'user_profile': user_profile}
+        return self.cache.get_or_compute(key, lambda: self.batcher.submit(item).result(self.timeout))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'cache': self.cache.stats(), 'batches': self.batcher.stats()}
+
+    def _analyze_batch(self, items: List[Dict]) -> List[Any]:
+        model = self.get_model()
+        if model is None:
+            raise RuntimeError('Gemini is not ready')
+        if self.budget is not None and not self.budget.acquire():
+            raise RuntimeError('Gemini budget exhausted')
+
+        prompt_items = [dict(item, id=f'p{index}') for index, item in enumerate(items)]
+        prompt = build_prompt(prompt_items)
+        start = time.perf_counter()
         try:
-            response = self.model.generate_content(prompt)
-            return json.loads(response.text)
-        except json.JSONDecodeError as e:
-            raise Exception(f"Invalid JSON from Gemini: {e}")
-        except Exception as e:
-            raise Exception(f"Gemini analysis failed: {e}")
- 
\ No newline at end of file
+            data, text = generate_json(model, prompt, BATCH_SCHEMA, self.timeout)
+        except Exception:
+            self._record_call(len(items), prompt, '', time.perf_counter() - start)
+            raise
+        self._record_call(len(items), prompt, text, time.perf_counter() - start)
+        by_id = {result.get('id'): result for result in data['results']}
+
+        results = []
+        for item in prompt_items:
+            result = by_id.get(item['id'])
+            if result is None:
+                results.append(LookupError(f"Gemini returned no analysis for {item['id']}"))
+                continue
+            result = {field: value for field, value in result.items() if field != 'id'}
+            try:
+                validate(result, ANALYSIS_SCHEMA)
+            except ValueError as e:
+                results.append(ValueError(f"Invalid analysis for {item['id']}: {e}"))
+                continue
+            # Kept even if the request that asked for it already gave up waiting
+            self.cache.set(item['key'], result)
+            results.append(result)
+        return results
+
+    def _record_call(self, items: int, prompt: str, text: str, seconds: float):
+        prompt_bytes, response_bytes = len(prompt.encode('utf-8')), len(text.encode('utf-8'))
+        if self.metrics is not None:
+            self.metrics.inc('gemini_calls_total', purpose='analysis')
+            self.metrics.inc('gemini_items_total', items, purpose='analysis')
+            self.metrics.inc('gemini_prompt_bytes_total', prompt_bytes, purpose='analysis')
+            self.metrics.inc('gemini_response_bytes_total', response_bytes, purpose='analysis')
+        if self.log is not None:
+            self.log.event('gemini_call', purpose='analysis', items=items, prompt_bytes=prompt_bytes,
+                           response_bytes=response_bytes, duration_ms=round(seconds * 1000, 1))
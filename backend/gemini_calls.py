@@ -0,0 +1,114 @@
+"""
+Deadline-bounded, streaming Gemini calls that return validated JSON.
+
+generate_json() streams the model's answer on a worker thread and stops reading
+as soon as the text holds a complete JSON object, whatever comes around it
+(code fences, "Here is your JSON:", trailing notes). The object is checked
+against a small schema so truncated or malformed answers are rejected rather
+than half-used. The caller waits at most `timeout` seconds: when the deadline
+passes it gets DeadlineExceeded right away, so its fallback starts then, and the
+worker stops consuming the stream at the next chunk.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Optional, Tuple
+
+CALL_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('GEMINI_CALL_WORKERS', 32)), thread_name_prefix='gemini-call')
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """
+    The first complete JSON object in `text`, ignoring code fences and prose around it.
+    None if the text holds no complete object (yet).
+    """
+    start = text.find('{')
+    while start != -1:
+        end = _object_end(text, start)
+        if end is None:
+            return None  # Still being streamed, or truncated
+        try:
+            return json.loads(text[start:end])
+        except ValueError:
+            start = text.find('{', start + 1)  # Braces in prose: try the next candidate
+    return None
+
+
+def _object_end(text: str, start: int) -> Optional[int]:
+    """Index just past the brace closing the one at `start`, skipping braces inside strings"""
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return None
+
+
+def validate(value: Any, schema: Any, path: str = '$'):
+    """
+    Raise ValueError unless `value` matches `schema`: a type or tuple of types, [item schema]
+    for a list, or {field: schema} for an object whose fields are all required.
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise ValueError(f"{path}: expected an object")
+        for field, field_schema in schema.items():
+            if field not in value:
+                raise ValueError(f"{path}.{field}: missing")
+            validate(value[field], field_schema, f"{path}.{field}")
+    elif isinstance(schema, list):
+        if not isinstance(value, list):
+            raise ValueError(f"{path}: expected a list")
+        for index, item in enumerate(value):
+            validate(item, schema[0], f"{path}[{index}]")
+    elif not isinstance(value, schema) or (isinstance(value, bool) and schema in (int, float, (int, float))):
+        raise ValueError(f"{path}: unexpected {type(value).__name__}")
+
+
+def generate_json(model, prompt: str, schema: Any, timeout: float) -> Tuple[Any, str]:
+    """
+    Ask `model` for a JSON answer matching `schema` within `timeout` seconds.
+    Returns (parsed object, text received); raises DeadlineExceeded or ValueError.
+    """
+    cancelled = threading.Event()
+    future = CALL_EXECUTOR.submit(_stream_json, model, prompt, schema, timeout, cancelled)
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        cancelled.set()
+        raise DeadlineExceeded(f"No complete answer within {timeout:.1f}s")
+
+
+def _stream_json(model, prompt: str, schema: Any, timeout: float, cancelled: threading.Event) -> Tuple[Any, str]:
+    response = model.generate_content(prompt, stream=True, request_options={'timeout': timeout})
+    text = ''
+    for chunk in response:
+        if cancelled.is_set():
+            break
+        text += chunk.text
+        value = extract_json(text)
+        if value is not None:
+            # The first complete object is the answer: stop reading and check it
+            validate(value, schema)
+            return value, text
+    raise ValueError(f"No complete JSON object in the answer: {text[:200]!r}")
@@ -0,0 +1,100 @@
+"""
+Shared HTTP client for all outbound calls.
+
+Each upstream (INCI Beauty, SerpAPI, ...) gets its own requests.Session with a
+keep-alive connection pool, a default timeout and retries with exponential
+backoff on 429 and 5xx responses (honouring Retry-After; the statuses are
+configurable per upstream), so repeated calls to the same host reuse their
+TCP/TLS connections instead of reconnecting.
+When given a Metrics registry, every call is counted per upstream and outcome
+(status class or exception) and timed, retries included.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_UPSTREAM = {
+    'timeout': 10,          # seconds, used when the caller does not pass one
+    'pool_connections': 4,  # number of hosts kept in the pool
+    'pool_maxsize': 32,     # keep-alive connections per host
+    'retries': 2,
+    'backoff_factor': 0.3,
+    'retry_statuses': RETRY_STATUSES,
+}
+
+
+class HttpClient:
+    def __init__(self, upstreams: Optional[Dict[str, Dict]] = None, metrics=None):
+        """`upstreams` maps an upstream name to overrides of DEFAULT_UPSTREAM."""
+        self.upstreams = {name: dict(DEFAULT_UPSTREAM, **config) for name, config in (upstreams or {}).items()}
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe('upstream_requests_total', 'counter', 'Upstream calls by outcome (HTTP status class, ok or exception)')
+            metrics.describe('upstream_request_seconds', 'histogram', 'Upstream call latency including retries')
+
+    def config(self, upstream: str) -> Dict:
+        return self.upstreams.get(upstream, DEFAULT_UPSTREAM)
+
+    def session(self, upstream: str) -> requests.Session:
+        session = self._sessions.get(upstream)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(upstream)
+                if session is None:
+                    session = self._build_session(self.config(upstream))
+                    self._sessions[upstream] = session
+        return session
+
+    @staticmethod
+    def _build_session(config: Dict) -> requests.Session:
+        retry = Retry(
+            total=config['retries'],
+            backoff_factor=config['backoff_factor'],
+            status_forcelist=config['retry_statuses'],
+            allowed_methods=frozenset(['GET']),
+            # urllib3 retries 429 with a Retry-After even outside status_forcelist; honour the upstream's choice
+            respect_retry_after_header=429 in config['retry_statuses'],
+            raise_on_status=False  # Hand the last response back so callers keep their status handling
+        )
+        adapter = HTTPAdapter(
+            pool_connections=config['pool_connections'],
+            pool_maxsize=config['pool_maxsize'],
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get(self, upstream: str, url: str, params: Optional[Dict] = None,
+            timeout: Optional[float] = None) -> requests.Response:
+        """GET through the upstream's pooled session; `timeout` overrides the upstream default."""
+        if timeout is None:
+            timeout = self.config(upstream)['timeout']
+        if self.metrics is None:
+            return self.session(upstream).get(url, params=params, timeout=timeout)
+
+        start = time.perf_counter()
+        outcome = 'exception'
+        try:
+            response = self.session(upstream).get(url, params=params, timeout=timeout)
+            outcome = f'{response.status_code // 100}xx'
+            return response
+        finally:
+            self.metrics.inc('upstream_requests_total', upstream=upstream, outcome=outcome)
+            self.metrics.observe('upstream_request_seconds', time.perf_counter() - start, upstream=upstream)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
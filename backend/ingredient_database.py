@@ -0,0 +1,179 @@
+"""
+Versioned, hot-reloadable snapshots of the ingredient and recommendation databases.
+
+A DatabaseSnapshot is built once from the JSON files and never mutated: it holds
+the parsed data, the compiled ScoringEngine (matcher and profile weights), the
+normalized name -> category map, the category metadata and the curated
+recommendation index. IngredientDatabase keeps the current snapshot; reload()
+builds a new one off to the side and swaps it in with a single reference
+assignment, so in-flight requests keep using the snapshot they started with.
+A polling file watcher can trigger reloads. The engine's per-token
+classification cache is preloaded from the previous snapshot's most frequent
+tokens on reload, and from `classification_file` (if given) at startup.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from curated_recommendations import CuratedRecommender
+from ingredient_tokenizer import normalize_name
+from scoring_engine import DEFAULT_WEIGHTAGE, ScoringEngine
+
+DATA_DIR = os.environ.get('DERMASCAN_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+BAD_INGREDIENTS_FILE = 'bad_ingredients.json'
+SKINCARE_RECOMMENDATIONS_FILE = 'skincare_recommendations.json'
+
+
+class DatabaseSnapshot(NamedTuple):
+    version: str  # content hash, identical on every node serving the same files
+    built_at: float
+    bad_ingredients: Dict[str, Dict]
+    skincare_recommendations: Dict[str, Dict]
+    engine: ScoringEngine
+    name_categories: Dict[str, str]  # normalized ingredient name -> category
+    categories: Dict[str, Dict]  # category -> description, severity, weightage
+    curated: CuratedRecommender  # skincare_recommendations indexed by skin type and product category
+
+
+def read_json(path: str):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return json.loads(raw), raw
+
+
+def build_snapshot(data_dir: str = DATA_DIR) -> DatabaseSnapshot:
+    """Load both databases and compile the index; raises if a file is missing or invalid."""
+    bad_ingredients, bad_raw = read_json(os.path.join(data_dir, BAD_INGREDIENTS_FILE))
+    recommendations, recommendations_raw = read_json(os.path.join(data_dir, SKINCARE_RECOMMENDATIONS_FILE))
+    return snapshot_from_data(bad_ingredients, recommendations, bad_raw + b'\0' + recommendations_raw)
+
+
+def snapshot_from_data(bad_ingredients: Dict, recommendations: Dict, raw: Optional[bytes] = None) -> DatabaseSnapshot:
+    if raw is None:
+        raw = json.dumps([bad_ingredients, recommendations], sort_keys=True).encode('utf-8')
+    engine = ScoringEngine(bad_ingredients)
+
+    name_categories = {}
+    for category, data in bad_ingredients.items():
+        for bad in data.get('ingredients', []):
+            name_categories.setdefault(normalize_name(bad), category)
+
+    categories = {
+        category: {
+            'description': data.get('description', ''),
+            'severity': data.get('severity', 'MODERATE'),
+            'weightage': data.get('weightage', DEFAULT_WEIGHTAGE)
+        }
+        for category, data in bad_ingredients.items()
+    }
+
+    return DatabaseSnapshot(
+        version=hashlib.sha256(raw).hexdigest()[:12],
+        built_at=time.time(),
+        bad_ingredients=bad_ingredients,
+        skincare_recommendations=recommendations,
+        engine=engine,
+        name_categories=name_categories,
+        categories=categories,
+        curated=CuratedRecommender(recommendations, engine)
+    )
+
+
+class IngredientDatabase:
+    def __init__(self, data_dir: str = DATA_DIR, classification_file: Optional[str] = None):
+        self.data_dir = data_dir
+        self.classification_file = classification_file
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.last_error = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        try:
+            self.current = build_snapshot(data_dir)
+        except (OSError, ValueError) as e:
+            # Keep serving (with an empty database) so /health can report the problem
+            print(f"Could not load ingredient database from {data_dir}: {e}")
+            self.last_error = str(e)
+            self.current = snapshot_from_data({}, {})
+        if classification_file and os.path.exists(classification_file):
+            try:
+                loaded = self.current.engine.classifications.load(classification_file, self.current.version)
+                print(f"Preloaded {loaded} ingredient classifications from {classification_file}")
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Could not preload ingredient classifications from {classification_file}: {e}")
+
+    def _after_fork(self):
+        # The watcher thread (and a reload it may have been running) stays with the parent
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+
+    def reload(self) -> DatabaseSnapshot:
+        """Rebuild from disk and swap the new snapshot in; keeps the old one if the files are invalid."""
+        with self._reload_lock:
+            try:
+                snapshot = build_snapshot(self.data_dir)
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+                print(f"Ingredient database reload failed, keeping version {self.current.version}: {e}")
+                raise
+            self.last_error = None
+            if snapshot.version != self.current.version:
+                print(f"Ingredient database updated: {self.current.version} -> {snapshot.version}")
+                # The tokens seen most are the same under the new database; only their answers may change
+                previous = self.current.engine.classifications
+                snapshot.engine.classifications.preload(previous.most_frequent(previous.max_entries // 2))
+                self.current = snapshot
+            return self.current
+
+    def save_classifications(self) -> int:
+        """Write the current classification cache to `classification_file`; returns the entries saved."""
+        if not self.classification_file:
+            return 0
+        snapshot = self.current
+        try:
+            return snapshot.engine.classifications.save(self.classification_file, snapshot.version)
+        except OSError as e:
+            print(f"Could not save ingredient classifications to {self.classification_file}: {e}")
+            return 0
+
+    def watch(self, interval: float):
+        """Poll the data files every `interval` seconds and reload when they change."""
+        if self._watcher is not None or interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch_loop, args=(interval,), daemon=True, name='database-watcher')
+        self._watcher.start()
+
+    def _watch_loop(self, interval: float):
+        last_seen = self._mtimes()
+        while True:
+            time.sleep(interval)
+            mtimes = self._mtimes()
+            if mtimes != last_seen:
+                last_seen = mtimes
+                try:
+                    self.reload()
+                except (OSError, ValueError):
+                    pass  # Already reported; retried on the next change
+
+    def _mtimes(self):
+        mtimes = []
+        for name in (BAD_INGREDIENTS_FILE, SKINCARE_RECOMMENDATIONS_FILE):
+            try:
+                mtimes.append(os.stat(os.path.join(self.data_dir, name)).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def status(self) -> Dict:
+        snapshot = self.current
+        return {
+            'version': snapshot.version,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(snapshot.built_at)),
+            'categories': len(snapshot.categories),
+            'ingredient_names': len(snapshot.name_categories),
+            'classification_cache': snapshot.engine.classifications.stats(),
+            'last_reload_error': self.last_error
+        }
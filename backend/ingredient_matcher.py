@@ -0,0 +1,116 @@
+"""
+Compiled multi-pattern matcher for the harmful ingredients database.
+
+All ingredient names from bad_ingredients.json are normalized and compiled once
+into an Aho-Corasick automaton, so each parsed ingredient is scanned a single
+time no matter how large the database grows. Matching keeps the original
+substring semantics: an ingredient is flagged if any database name occurs
+inside it, and it is assigned to the first category in database order.
+Tokens that are exactly a database name are answered by a dict lookup.
+"""
+from typing import Dict, List, Optional
+
+from ingredient_tokenizer import normalize_name
+
+
+class IngredientMatcher:
+    def __init__(self, bad_ingredients: Dict[str, Dict]):
+        """Build the automaton from the {category: {'ingredients': [...]}} database."""
+        self.categories: List[str] = list(bad_ingredients.keys())
+        self.pattern_count = 0
+
+        # Trie transitions, failure links and, per state, the lowest category
+        # index of any pattern ending there (or reachable through failure links)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[int] = [-1]
+
+        patterns = []
+        for index, category in enumerate(self.categories):
+            for bad in bad_ingredients[category].get('ingredients', []):
+                pattern = normalize_name(bad)
+                self._add_pattern(pattern, index)
+                patterns.append(pattern)
+
+        self._build_failure_links()
+
+        # Exact database names resolve with one hash lookup (the scan result accounts for
+        # shorter names from earlier categories occurring inside them)
+        self._exact: Dict[str, int] = {pattern: self._scan(pattern) for pattern in patterns}
+
+    def _add_pattern(self, pattern: str, category_index: int):
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(-1)
+            state = next_state
+
+        if self._best[state] == -1 or category_index < self._best[state]:
+            self._best[state] = category_index
+        self.pattern_count += 1
+
+    def _build_failure_links(self):
+        # Breadth-first so every failure target is finalised before it is used
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._best[state] = self._merge(self._best[state], self._best[0])
+
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._best[next_state] = self._merge(
+                    self._best[next_state], self._best[self._fail[next_state]]
+                )
+                queue.append(next_state)
+
+    @staticmethod
+    def _merge(a: int, b: int) -> int:
+        if a == -1:
+            return b
+        if b == -1:
+            return a
+        return min(a, b)
+
+    def classify_index(self, ingredient: str) -> int:
+        """Return the index of the first matching category, or -1 if none match."""
+        index = self._exact.get(ingredient)
+        if index is not None:
+            return index
+        return self._scan(ingredient)
+
+    def _scan(self, ingredient: str) -> int:
+        goto = self._goto
+        fail = self._fail
+        best_of = self._best
+
+        best = best_of[0]
+        if best == 0:
+            return 0
+
+        state = 0
+        for ch in ingredient:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            found = best_of[state]
+            if found != -1 and (best == -1 or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+    def classify(self, ingredient: str) -> Optional[str]:
+        """Return the first category whose names occur in the ingredient, or None."""
+        index = self.classify_index(ingredient)
+        return self.categories[index] if index != -1 else None
@@ -0,0 +1,116 @@
+"""
+Single-pass tokenizer and normalizer for INCI ingredient lists.
+
+One compiled regex walks the text once, a whole run of ordinary characters at a
+time, and emits ingredient tokens, splitting on , ; newlines and bullets, but
+not on separators inside parentheses ("Parfum (Fragrance, Aroma)"), on decimal
+points ("0.5%") or on numbered names ("FD&C Red No. 40"). The few tokens that
+contain "and/or" are split on it (outside parentheses) in a second pass. "May
+contain" markers, their brackets and organic asterisks are dropped. A token
+with parenthesised synonyms stays whole; synonym_names gives its separate
+names, as extra candidates for matching it. Tokens are canonicalised
+(Unicode NFKC, casefolded, dashes unified, whitespace collapsed) the same way
+normalize_name canonicalises database names, interned, and cached per input
+string.
+"""
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from typing import List, Tuple
+
+TOKENIZE_CACHE_SIZE = 8192
+
+# Dash and quote variants that NFKC leaves alone
+_CHARACTER_MAP = str.maketrans({
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '−': '-',
+    '‘': "'", '’': "'", '´': "'",
+})
+
+_TOKEN_RE = re.compile(r"""
+    (?:
+        \([^()]*\)                               # parenthesised synonyms keep their commas
+      | \.(?=\s*\d)                              # decimal points and "No. 40"
+      | [^,;.\n•·()]++                           # runs of anything that is not a separator
+      | [()]                                     # unbalanced parentheses stay in the token
+    )++
+""", re.VERBOSE)
+
+# "and/or" splits a token, except inside the parenthesised groups _TOKEN_RE keeps whole
+_AND_OR_RE = re.compile(r'\([^()]*\)|\s+(?=and/or\s)')
+
+# What _TOKEN_RE is needed for besides parentheses and "and/or"
+_DECIMAL_RE = re.compile(r'\.\s*\d')
+_SEPARATOR_RE = re.compile(r'[,;.\n•·]')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# "and/or" joiners and "may contain" markers around tokens, with their brackets: "May contain: [+/- CI 77491, Mica]"
+_MARKER_RE = re.compile(r'^(?:and/or\s+|\+/-\s*:?\s*|may contain\s*:?\s*|\[\s*)+')
+
+# Parenthesised synonyms and the separators between them: "parfum (fragrance, aroma)"
+_SYNONYM_GROUP_RE = re.compile(r'\(([^()]*)\)')
+_SYNONYM_SEPARATOR_RE = re.compile(r'[,;]|\s+and/or\s+')
+
+
+def normalize_name(name: str) -> str:
+    """Canonical form of an ingredient name, shared by parsed tokens and database names."""
+    name = unicodedata.normalize('NFKC', name).casefold().translate(_CHARACTER_MAP)
+    return _WHITESPACE_RE.sub(' ', name).strip()
+
+
+@lru_cache(maxsize=TOKENIZE_CACHE_SIZE)
+def tokenize_ingredients(text: str) -> Tuple[str, ...]:
+    """Split an ingredient list into canonical, interned tokens (cached for repeated strings)."""
+    if text.isascii():
+        # NFKC and the character map leave ASCII alone, and casefold is lower
+        text = text.lower()
+    else:
+        text = unicodedata.normalize('NFKC', text).casefold().translate(_CHARACTER_MAP)
+    and_or = 'and/or' in text
+    if and_or:
+        pieces = _split_and_or(text)
+    elif '(' in text or _DECIMAL_RE.search(text):
+        pieces = _TOKEN_RE.findall(text)
+    else:
+        # No parentheses, decimals or "and/or": every separator ends a token
+        pieces = _SEPARATOR_RE.split(text)
+    if and_or or '  ' in text or not text.isprintable() or '+/-' in text or 'may contain' in text:
+        tokens = [_clean_token(piece) for piece in pieces]
+    else:
+        # Single spaces only and no markers: stripping is all the cleanup a token needs
+        tokens = [piece.strip(' *[]') for piece in pieces]
+    return tuple([sys.intern(token) for token in tokens if token])
+
+
+@lru_cache(maxsize=TOKENIZE_CACHE_SIZE)
+def synonym_names(token: str) -> Tuple[str, ...]:
+    """The names a token with parentheses stands for ("parfum (fragrance, aroma)" -> parfum, fragrance, aroma), interned."""
+    names = []
+    for group in [_SYNONYM_GROUP_RE.sub(' ', token)] + _SYNONYM_GROUP_RE.findall(token):
+        for name in _SYNONYM_SEPARATOR_RE.split(group):
+            name = _clean_token(name)
+            if name and name not in names:
+                names.append(sys.intern(name))
+    return tuple(names)
+
+
+def _split_and_or(text: str) -> List[str]:
+    pieces = []
+    for match in _TOKEN_RE.finditer(text):
+        start, end = match.span()
+        if 'and/or' in match.group():
+            # Searched in the whole text so the lookahead sees the separator after a trailing "and/or"
+            for joiner in _AND_OR_RE.finditer(text, start):
+                if joiner.start() >= end:
+                    break
+                if joiner.group()[0] != '(':
+                    pieces.append(text[start:joiner.start()])
+                    start = joiner.end()
+        pieces.append(text[start:end])
+    return pieces
+
+
+def _clean_token(token: str) -> str:
+    token = _WHITESPACE_RE.sub(' ', token).strip(' *[]')
+    return _MARKER_RE.sub('', token).strip(' *[]')
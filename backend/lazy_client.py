@@ -0,0 +1,125 @@
+"""
+Background, retrying initialization for heavy optional clients (Gemini).
+
+Importing and constructing a client such as google.generativeai's model takes
+seconds and may fail (missing package, bad key, network). LazyClient keeps that
+off the import path: start() or the first get() runs the factory on a
+background thread, get() returns None until the client is ready, and a failed
+attempt is retried after `retry_interval` seconds instead of disabling the
+client for the life of the process. A client built before a fork is not reused
+by a forked child, which builds its own.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+PENDING = 'pending'
+INITIALIZING = 'initializing'
+READY = 'ready'
+FAILED = 'failed'
+DISABLED = 'disabled'
+
+
+class LazyClient:
+    def __init__(self, name: str, factory: Callable[[], Any], retry_interval: float = 60, log=None):
+        self.name = name
+        self.factory = factory
+        self.retry_interval = retry_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._installed = False
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The initializing thread (and often the client's connections) did not survive the fork
+        self._lock = threading.Lock()
+        if not self._installed:
+            self._reset()
+
+    def _reset(self):
+        self._client = None
+        self._ready = threading.Event()
+        self.state = PENDING
+        self.last_error = None
+        self.attempts = 0
+        self._retry_at = 0.0
+        self.ready_at = None
+
+    def get(self) -> Optional[Any]:
+        """The client if it is ready, otherwise None (initialization is started in the background)."""
+        client = self._client
+        if client is None:
+            self.start()
+        return client
+
+    def start(self):
+        """Start initializing in the background unless it is ready, in progress or waiting to retry."""
+        if self.state == READY:
+            return
+        with self._lock:
+            if self.state in (READY, INITIALIZING, DISABLED):
+                return
+            if self.state == FAILED and time.monotonic() < self._retry_at:
+                return
+            self.state = INITIALIZING
+            self.attempts += 1
+        threading.Thread(target=self._initialize, daemon=True, name=f'{self.name}-init').start()
+
+    def wait(self, timeout: float) -> Optional[Any]:
+        """Start initializing if needed and wait up to `timeout` seconds for the client."""
+        deadline = time.monotonic() + timeout
+        client = self.get()
+        while client is None and self.state == INITIALIZING and time.monotonic() < deadline:
+            self._ready.wait(min(0.05, max(0.0, deadline - time.monotonic())))
+            client = self.get()
+        return client
+
+    def set(self, client: Any):
+        """Use an already constructed client (tests, stubs)."""
+        with self._lock:
+            self._reset()
+            self._installed = True
+            self._client = client
+            self.state = READY
+            self.ready_at = time.time()
+            self._ready.set()
+
+    def disable(self):
+        """Never initialize; get() always returns None."""
+        with self._lock:
+            self._reset()
+            self._installed = True
+            self.state = DISABLED
+
+    def status(self) -> Dict[str, Any]:
+        status = {'state': self.state, 'attempts': self.attempts, 'last_error': self.last_error}
+        if self.state == FAILED:
+            status['retry_in'] = round(max(0.0, self._retry_at - time.monotonic()), 1)
+        return status
+
+    def _initialize(self):
+        start = time.perf_counter()
+        try:
+            client = self.factory()
+        except Exception as e:
+            with self._lock:
+                self.state = FAILED
+                self.last_error = f'{type(e).__name__}: {e}'
+                self._retry_at = time.monotonic() + self.retry_interval
+            self._event('client_unavailable', attempt=self.attempts, retry_in=self.retry_interval, error=str(e))
+            return
+        with self._lock:
+            self._client = client
+            self.state = READY
+            self.last_error = None
+            self.ready_at = time.time()
+            self._ready.set()
+        self._event('client_ready', seconds=round(time.perf_counter() - start, 2))
+
+    def _event(self, event: str, **fields):
+        # At most once per attempt, so never sampled away
+        if self.log is not None:
+            self.log.event(event, sample=True, client=self.name, **fields)
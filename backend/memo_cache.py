@@ -0,0 +1,148 @@
+"""
+Memoization cache with stale-while-revalidate for slow, deterministic upstream calls.
+
+Fresh entries are served directly. Entries past their TTL but still inside the
+stale window are served immediately while a single background call refreshes
+them. Misses are computed once per key even under concurrency (single-flight),
+and entries can optionally be persisted to a SQLite file.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from single_flight import SingleFlight
+
+
+class MemoCache:
+    def __init__(self, ttl: float, stale_ttl: float = 0, max_entries: int = 1024,
+                 db_path: Optional[str] = None, table: str = 'memo', log=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.flight = SingleFlight()
+        self.log = log
+
+        # key -> (stored_at, value)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        self._table = table
+        self._db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)"
+            )
+            self._db.commit()
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._reconnect)
+
+    def _reconnect(self):
+        # A SQLite connection must not be used across a fork. The inherited one is kept
+        # (not closed) so that closing it cannot touch the parent's database state.
+        self._inherited_db = self._db
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, computing (or refreshing) it with compute() as needed."""
+        entry = self._lookup(key)
+        now = time.time()
+
+        if entry is not None:
+            age = now - entry[0]
+            if age < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                if not self.flight.in_flight(key):
+                    threading.Thread(target=self._refresh, args=(key, compute), daemon=True).start()
+                return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return self.flight.do(key, lambda: self._compute_and_store(key, compute))
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (fresh or stale) without computing, refreshing or counting it."""
+        entry = self._lookup(key)
+        if entry is not None and time.time() - entry[0] < self.ttl + self.stale_ttl:
+            return entry[1]
+        return default
+
+    def set(self, key: Hashable, value: Any, stored_at: Optional[float] = None):
+        stored_at = time.time() if stored_at is None else stored_at
+        self._remember(key, value, stored_at)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, stored_at) VALUES (?, ?, ?)",
+                    (self._db_key(key), json.dumps(value), stored_at)
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'persistent': self._db is not None
+            }
+        stats.update(coalesced=self.flight.stats()['coalesced'])
+        return stats
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Any]):
+        try:
+            self.flight.do(key, lambda: self._compute_and_store(key, compute))
+        except Exception as e:
+            if self.log is not None:
+                self.log.event('cache_refresh_failed', table=self._table, key=key, error=str(e))
+
+    def _compute_and_store(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def _lookup(self, key: Hashable) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                f"SELECT value, stored_at FROM {self._table} WHERE key = ?", (self._db_key(key),)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = (row[1], json.loads(row[0]))
+        self._remember(key, entry[1], entry[0])
+        return entry
+
+    def _remember(self, key: Hashable, value: Any, stored_at: float):
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _db_key(key: Hashable) -> str:
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
@@ -0,0 +1,157 @@
+"""
+In-process metrics with Prometheus text exposition, plus sampled structured logs.
+
+Metrics keeps labelled counters and histograms behind one lock; collectors are
+callables evaluated at scrape time for values that already live elsewhere (cache
+statistics). span(stage) times a block into the stage histogram and, inside a
+trace(), into the current request's span map so one log line can carry the
+breakdown. StructuredLog prints one JSON object per event to stdout, keeping
+only a sample of routine events; errors are always written.
+"""
+import contextvars
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# stage -> seconds for the request being handled on this thread / task
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('trace', default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+Collector = Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]
+
+
+class Metrics:
+    def __init__(self, namespace: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._types: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[Labels, list]] = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+        self.describe('stage_seconds', 'histogram', 'Time spent in each stage of request handling')
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self._types[name] = (metric_type, help_text)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def collector(self, collect: Collector):
+        """Register a callable yielding (name, labels, value) samples at scrape time."""
+        self._collectors.append(collect)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time a block into stage_seconds{stage=...} and the current trace, if any."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe('stage_seconds', elapsed, stage=stage)
+            spans = _current_trace.get()
+            if spans is not None:
+                spans[stage] = spans.get(stage, 0) + elapsed
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        samples: Dict[str, list] = {}
+        with self._lock:
+            for name, series in self._counters.items():
+                samples[name] = [(name, key, value) for key, value in series.items()]
+            for name, series in self._histograms.items():
+                rows = samples[name] = []
+                for key, state in series.items():
+                    for bound, count in zip(self.buckets, state):
+                        rows.append((name + '_bucket', key + (('le', format_value(bound)),), count))
+                    rows.append((name + '_bucket', key + (('le', '+Inf'),), state[-1]))
+                    rows.append((name + '_sum', key, state[-2]))
+                    rows.append((name + '_count', key, state[-1]))
+
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    samples.setdefault(name, []).append((name, self._labels(labels), value))
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+
+        lines = []
+        for name in sorted(samples):
+            full_name = f"{self.namespace}_{name}"
+            metric_type, help_text = self._types.get(name, ('untyped', ''))
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for sample_name, key, value in samples[name]:
+                label_text = ','.join(f'{label}="{escape(text)}"' for label, text in key)
+                suffix = f"{{{label_text}}}" if label_text else ''
+                lines.append(f"{self.namespace}_{sample_name}{suffix} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(labels: Dict) -> Labels:
+        return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+@contextmanager
+def trace() -> Iterator[Dict[str, float]]:
+    """Collect the spans recorded by this thread (or task) until the block exits."""
+    spans: Dict[str, float] = {}
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+class StructuredLog:
+    def __init__(self, sample_rate: float = 0.01):
+        self.sample_rate = sample_rate
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def event(self, event: str, sample: Optional[bool] = None, **fields):
+        """Log a routine event if it is sampled (pass `sample` to reuse a per-request decision, or True to always log it)."""
+        if sample if sample is not None else self.sampled():
+            self._write('info', event, fields)
+
+    def error(self, event: str, **fields):
+        self._write('error', event, fields)
+
+    @staticmethod
+    def _write(level: str, event: str, fields: Dict):
+        record = {'ts': round(time.time(), 3), 'level': level, 'event': event}
+        record.update(fields)
+        print(json.dumps(record, default=str))
@@ -0,0 +1,99 @@
+"""
+Micro-batching scheduler.
+
+submit() queues an item and returns a Future. A collector thread takes the
+first queued item, keeps collecting until the batch holds `max_batch_size`
+items or `max_wait` seconds have passed since that first item, and hands the
+batch to `process(items) -> results` on a small worker pool. Each Future gets
+the result at its position (an Exception instance in the results fails just
+that item); if process() raises, the whole batch fails with that exception.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+
+class MicroBatcher:
+    def __init__(self, process: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait: float = 0.05, max_workers: int = 4, name: str = 'batch'):
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_workers = max_workers
+        self.name = name
+        self._lock = threading.Lock()
+        self._reset()
+        self.batches = 0
+        self.items = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._collector = None
+        self._executor = None
+
+    def _after_fork(self):
+        # Neither the collector thread nor the workers survive a fork
+        self._lock = threading.Lock()
+        self._reset()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches, items = self.batches, self.items
+        return {
+            'batches': batches,
+            'items': items,
+            'average_batch_size': round(items / batches, 2) if batches else 0.0,
+            'queued': self._queue.qsize()
+        }
+
+    def _ensure_started(self):
+        if self._collector is not None:
+            return
+        with self._lock:
+            if self._collector is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                self._collector = threading.Thread(target=self._collect, daemon=True, name=f'{self.name}-collector')
+                self._collector.start()
+
+    def _collect(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            results = self.process([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for index, (_, future) in enumerate(batch):
+            result = results[index] if index < len(results) else LookupError('No result for this item')
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,127 @@
+"""
+Two-tier product cache keyed by barcode (EAN/UPC).
+
+The in-process tier is an LRU bounded by entry count and by the approximate
+serialized size of the cached products. The optional on-disk tier is a SQLite
+file, so cached products survive restarts and are shared by every process
+pointing at the same file. Unknown barcodes are cached as negative results
+with their own (shorter) TTL, so they are not looked up again on every scan.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+MISSING = object()
+
+
+class ProductCache:
+    def __init__(self, ttl: float = 24 * 3600, negative_ttl: float = 15 * 60,
+                 max_entries: int = 10000, max_bytes: int = 32 * 1024 * 1024,
+                 db_path: Optional[str] = None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # key -> (expires_at, value, size); value None marks a negative result
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS products (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM products WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._reconnect)
+
+    def _reconnect(self):
+        # A SQLite connection must not be used across a fork. The inherited one is kept
+        # (not closed) so that closing it cannot touch the parent's database state.
+        self._inherited_db = self._db
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        """Return the cached product, None for a cached negative result, or `default`."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._copy(entry[1])
+                self._remove(key)
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM products WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._store(key, value, row[1], len(row[0]))
+                with self._lock:
+                    self.hits += 1
+                return self._copy(value)
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: str, product: Optional[Dict]):
+        """Cache a product, or None to remember that the barcode is unknown."""
+        expires_at = time.time() + (self.ttl if product is not None else self.negative_ttl)
+        serialized = json.dumps(product)
+        self._store(key, product, expires_at, len(serialized))
+
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO products (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, serialized, expires_at)
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'persistent': self._db is not None
+            }
+
+    def _store(self, key: str, value: Optional[Dict], expires_at: float, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+            # Evict least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    @staticmethod
+    def _copy(value: Optional[Dict]) -> Optional[Dict]:
+        return dict(value) if value is not None else None
@@ -0,0 +1,198 @@
+"""
+Pluggable chain of product sources for barcode lookups.
+
+Every barcode variant (EAN-13 / UPC-A) is looked up once per source, and all
+lookups run concurrently. Each source has its own timeout and circuit breaker,
+and can be delayed by a hedge delay so that it only fires when the faster
+sources have not answered yet. The first complete composition (a product with
+ingredients) wins. Concurrent lookups of the same product (in any barcode form)
+share one in-flight lookup.
+
+A source's timeout runs from when its fetch starts on the pool, so time spent
+queued behind other lookups never counts against the source's circuit breaker.
+A fetch still queued when its lookup is over (or after waiting a whole source
+timeout for a thread) is cancelled.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from single_flight import SingleFlight
+
+
+class ProductSourceError(Exception):
+    """A source failed to answer (network error, timeout, 5xx...), as opposed to not knowing the product."""
+
+
+def barcode_variants(barcode: str) -> List[str]:
+    """Return the barcode as scanned plus its EAN-13 / UPC-A equivalent."""
+    barcode = barcode.strip()
+    variants = [barcode]
+    if barcode.isdigit():
+        if len(barcode) == 13 and barcode.startswith("0"):
+            # EAN-13 with a leading zero is the 12-digit UPC-A
+            variants.insert(0, barcode[1:])
+        elif len(barcode) == 12:
+            variants.append("0" + barcode)
+    return variants
+
+
+def normalize_barcode(barcode: str) -> str:
+    """Canonical EAN-13 form of a barcode, so UPC-A and EAN-13 scans of a product share cache entries."""
+    barcode = barcode.strip()
+    if barcode.isdigit() and len(barcode) == 12:
+        return "0" + barcode
+    return barcode
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """Open after `failure_threshold` consecutive failures, probe again after `reset_timeout` seconds."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: let requests through until the next result decides
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+
+class ProductSource:
+    def __init__(self, name: str, fetch: Callable[[str, float], Optional[Dict]],
+                 timeout: float = 10, hedge_delay: float = 0,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        `fetch(barcode, timeout)` returns a product dict, None when the source does not
+        know the barcode, or raises ProductSourceError when it could not answer.
+        """
+        self.name = name
+        self.fetch = fetch
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+
+
+class ProductSourceChain:
+    def __init__(self, sources: List[ProductSource], max_workers: int = 16, log=None):
+        self.sources = sources
+        self.log = log
+        self.flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='product-source')
+
+    def lookup(self, barcode: str) -> Optional[Dict]:
+        """
+        Look up every barcode variant in every source concurrently.
+        Returns the first product with ingredients, otherwise the best product found
+        without ingredients (by source order, then variant order), otherwise None.
+        """
+        return self.flight.do(normalize_barcode(barcode), lambda: self._lookup(barcode))
+
+    def _event(self, event: str, **fields):
+        if self.log is not None:
+            self.log.event(event, **fields)
+
+    @staticmethod
+    def _fetch(source: ProductSource, variant: str, started: list):
+        started.append(time.monotonic())
+        return source.fetch(variant, source.timeout)
+
+    def _lookup(self, barcode: str) -> Optional[Dict]:
+        variants = barcode_variants(barcode)
+        start = time.monotonic()
+        waiting = [(start + source.hedge_delay, priority, source) for priority, source in enumerate(self.sources)]
+        # future -> (priority, variant index, source, submitted at, [started at] once running)
+        pending = {}
+        partial = {}
+        try:
+            return self._collect(variants, waiting, pending, partial)
+        finally:
+            # Fetches that never got a thread are not needed any more; running ones finish
+            # in the background (and fill their caches)
+            for future in pending:
+                future.cancel()
+
+    def _collect(self, variants, waiting, pending, partial) -> Optional[Dict]:
+        while waiting or pending:
+            now = time.monotonic()
+
+            # Start sources whose hedge delay has passed
+            for entry in [entry for entry in waiting if entry[0] <= now]:
+                waiting.remove(entry)
+                _, priority, source = entry
+                if not source.breaker.allow():
+                    self._event('product_source_skipped', source=source.name, reason='circuit_open')
+                    continue
+                for variant_index, variant in enumerate(variants):
+                    started = []
+                    future = self._executor.submit(self._fetch, source, variant, started)
+                    pending[future] = (priority, variant_index, source, now, started)
+
+            # Give up on lookups that ran past their source timeout. Only a fetch that was
+            # running counts as a source failure; one still queued is dropped as local overload.
+            deadlines = []
+            for future, (_, _, source, submitted, started) in list(pending.items()):
+                deadline = (started[0] if started else submitted) + source.timeout
+                if deadline > now:
+                    deadlines.append(deadline)
+                    continue
+                del pending[future]
+                if future.cancel():
+                    self._event('product_source_skipped', source=source.name, reason='no_free_worker')
+                else:
+                    source.breaker.record_failure()
+                    self._event('product_source_timeout', source=source.name, timeout=source.timeout)
+
+            if not pending and not waiting:
+                break
+
+            next_event = min([entry[0] for entry in waiting] + deadlines)
+            if not pending:
+                time.sleep(max(0, next_event - now))
+                continue
+
+            done, _ = wait(list(pending), timeout=max(0, next_event - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                priority, variant_index, source, _, _ = pending.pop(future)
+                try:
+                    product = future.result()
+                except Exception as e:
+                    source.breaker.record_failure()
+                    self._event('product_source_error', source=source.name, error=str(e))
+                    continue
+
+                source.breaker.record_success()
+                if product and product.get('ingredients'):
+                    # Lookups still in flight finish in the background (and fill their caches)
+                    return product
+                if product:
+                    partial[(priority, variant_index)] = product
+
+        return partial[min(partial)] if partial else None
@@ -0,0 +1,169 @@
+"""
+Background jobs for the slow part of a scan (product alternatives).
+
+/analyze answers with the local analysis right away and hands out a job id; the
+job runs on a bounded worker pool and its result is kept for a while so clients
+can poll it or wait on it (long-poll / server-sent events). Finished jobs expire
+after `ttl` seconds and at most `max_jobs` are remembered. With `db_path`, job
+states are also written to a SQLite file, so a process that did not run a job
+(another server worker) can still answer polls for it.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+SHARED_POLL_INTERVAL = 0.1  # seconds between checks on a job run by another process
+
+
+class Job:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = PENDING
+        self.result = None
+        self.created_at = time.time()
+        self.finished = threading.Event()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'id': self.id, 'status': self.status, 'result': self.result}
+
+
+class RecommendationJobs:
+    def __init__(self, max_workers: int = 8, ttl: float = 600, max_jobs: int = 10000,
+                 db_path: Optional[str] = None, cleanup_every: int = 1000, log=None):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.log = log
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommendation-job')
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Opened on first use in each process: a SQLite connection must not be used across a fork
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._cleanup_every = cleanup_every
+        self._published = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The inherited connection is kept (not closed) so that closing it cannot touch the parent's
+        self._inherited_db = self._db
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    def submit(self, compute: Callable[[], Any]) -> str:
+        """Start compute() in the background and return the job id."""
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        self._publish(job)
+        self._executor.submit(self._run, job, compute)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._find(job_id)
+        return job.snapshot() if job is not None else self._load(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to `timeout` seconds for the job to finish; returns its state (None if unknown)."""
+        job = self._find(job_id)
+        if job is None:
+            return self._wait_shared(job_id, timeout)
+        job.finished.wait(timeout)
+        return job.snapshot()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == PENDING)
+            return {'jobs': len(self._jobs), 'pending': pending}
+
+    def _find(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or time.time() - job.created_at > self.ttl:
+            return None
+        return job
+
+    def _event(self, event: str, **fields):
+        if self.log is not None:
+            self.log.event(event, **fields)
+
+    def _run(self, job: Job, compute: Callable[[], Any]):
+        try:
+            job.result = compute()
+            job.status = DONE
+        except Exception as e:
+            self._event('recommendation_job_failed', job=job.id, error=str(e))
+            job.status = FAILED
+        finally:
+            job.finished.set()
+            self._publish(job)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, result TEXT, created_at REAL)")
+            self._db = db
+        return self._db
+
+    def _publish(self, job: Job):
+        if not self.db_path:
+            return
+        try:
+            result = json.dumps(job.result)
+            with self._db_lock:
+                db = self._connection()
+                db.execute("INSERT OR REPLACE INTO jobs (id, status, result, created_at) VALUES (?, ?, ?, ?)",
+                           (job.id, job.status, result, job.created_at))
+                self._published += 1
+                if self._published % self._cleanup_every == 0:
+                    db.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - self.ttl,))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            # Polls answered by this process still work
+            self._event('recommendation_job_share_failed', job=job.id, error=str(e))
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """State of a job run by another process, from the shared file"""
+        if not self.db_path:
+            return None
+        try:
+            with self._db_lock:
+                row = self._connection().execute(
+                    "SELECT status, result, created_at FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self._event('recommendation_job_read_failed', job=job_id, error=str(e))
+            return None
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return {'id': job_id, 'status': row[0], 'result': json.loads(row[1])}
+
+    def _wait_shared(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._load(job_id)
+            if snapshot is None or snapshot['status'] != PENDING or time.monotonic() >= deadline:
+                return snapshot
+            time.sleep(min(SHARED_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    def _expire(self):
+        # Jobs are ordered by creation time, so expired ones are at the front
+        now = time.time()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if now - job.created_at <= self.ttl and len(self._jobs) < self.max_jobs:
+                break
+            self._jobs.popitem(last=False)
@@ -0,0 +1,84 @@
+"""
+Whole-response cache for /analyze.
+
+Stores the serialized JSON body of successful responses together with a strong
+ETag derived from the body, in an LRU bounded by entry count and total bytes.
+Callers build keys that include the database snapshot version, so a database
+update makes every older entry unreachable (they age out of the LRU).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value covers `etag` (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag == etag or tag == 'W/' + etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = 3600, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # key -> (expires_at, body, etag)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, str]]:
+        """Return (body, etag) for a fresh entry, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], entry[2]
+                self._remove(key)
+            self.misses += 1
+        return None
+
+    def set(self, key: Hashable, body: bytes) -> str:
+        """Cache a serialized response body and return its ETag."""
+        etag = make_etag(body)
+        if len(body) > self.max_bytes:
+            return etag
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, body, etag)
+            self._bytes += len(body)
+            # Evict least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return etag
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _remove(self, key: Hashable):
+        _, body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
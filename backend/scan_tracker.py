@@ -0,0 +1,129 @@
+"""
+Bounded fixed-window hit counters for rate limiting and upstream budgets.
+
+ScanTracker.hit(key) counts hits of a key in a window of `ttl` seconds that
+starts with the key's first hit. The default backend is in-process: keys are
+spread over lock-striped shards, each an LRU bounded to its share of
+`max_entries` that drops expired windows first, so memory stays flat however
+many distinct keys arrive. Windows are dropped in the order they started, so
+one in-process backend should only count windows of one length. A SQLite file or a Redis-compatible server can be
+used instead so that counts are shared by every worker process and node.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int = 100000, shards: int = 16):
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._shard_capacity = max(1, max_entries // shards)
+
+    def hit(self, key: str, ttl: float) -> int:
+        index = zlib.crc32(key.encode('utf-8')) % len(self._shards)
+        shard = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            # key -> [window end, count]; ordered by window start, so the oldest windows are at the front
+            while shard:
+                oldest_key, (expires_at, _) = next(iter(shard.items()))
+                if expires_at > now and len(shard) < self._shard_capacity:
+                    break
+                del shard[oldest_key]
+
+            entry = shard.get(key)
+            if entry is None or entry[0] <= now:
+                shard.pop(key, None)
+                shard[key] = [now + ttl, 1]
+                return 1
+            entry[1] += 1
+            return entry[1]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+class SqliteBackend:
+    def __init__(self, path: str, cleanup_every: int = 1000):
+        self._path = path
+        self._connect()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS scan_windows (key TEXT PRIMARY KEY, expires_at REAL, count INTEGER)")
+        self._cleanup_every = cleanup_every
+        self._hits = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self):
+        self._db = sqlite3.connect(self._path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        # A SQLite connection must not be used across a fork. The inherited one is kept
+        # (not closed) so that closing it cannot checkpoint the WAL under the parent.
+        self._inherited_db = self._db
+        self._connect()
+
+    def hit(self, key: str, ttl: float) -> int:
+        # Wall clock, so that every process sharing the file agrees on window boundaries
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT expires_at, count FROM scan_windows WHERE key = ?", (key,)).fetchone()
+                if row is None or row[0] <= now:
+                    count = 1
+                    self._db.execute("INSERT OR REPLACE INTO scan_windows (key, expires_at, count) VALUES (?, ?, 1)", (key, now + ttl))
+                else:
+                    count = row[1] + 1
+                    self._db.execute("UPDATE scan_windows SET count = ? WHERE key = ?", (count, key))
+
+                self._hits += 1
+                if self._hits % self._cleanup_every == 0:
+                    self._db.execute("DELETE FROM scan_windows WHERE expires_at <= ?", (now,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return count
+
+
+class RedisBackend:
+    def __init__(self, url: str, prefix: str = 'dermascan:scans:'):
+        import redis  # Optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def hit(self, key: str, ttl: float) -> int:
+        name = self._prefix + key
+        # MULTI/EXEC: the first hit of a window creates the counter with its expiry, INCR keeps the expiry
+        pipeline = self._redis.pipeline(transaction=True)
+        pipeline.set(name, 0, px=max(1, int(ttl * 1000)), nx=True)
+        pipeline.incr(name)
+        return pipeline.execute()[1]
+
+
+def make_backend(url: Optional[str], max_entries: int = 100000):
+    """'' -> in-process shards, 'sqlite:///path/to/file.db' -> SQLite, 'redis://host:port/db' -> Redis."""
+    if not url:
+        return MemoryBackend(max_entries=max_entries)
+    if url.startswith('sqlite:///'):
+        return SqliteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported scan tracker URL: {url}")
+
+
+class ScanTracker:
+    def __init__(self, ttl: float, backend=None):
+        self.ttl = ttl
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    def hit(self, key: str) -> int:
+        """Record a hit and return how many hits `key` has had in its current window."""
+        return self.backend.hit(key, self.ttl)
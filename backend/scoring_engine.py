@@ -0,0 +1,178 @@
+"""
+Shared scoring engine for ingredient analysis.
+
+Detection runs once per ingredient list through the compiled IngredientMatcher,
+with each token's category memoized across requests by a ClassificationCache.
+The profile rules (age multipliers and skin type penalties) are turned into a
+table of per-profile weights at load time, so a personalized score is a couple
+of multiplications over the detection's weighted hit count plus one table
+lookup per matched category, and one detection can be scored against any
+number of profiles.
+"""
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from classification_cache import ClassificationCache
+from ingredient_matcher import IngredientMatcher
+from ingredient_tokenizer import synonym_names
+
+DEFAULT_WEIGHTAGE = 10
+
+# Age-based adjustments (multiplier for weightage impact)
+AGE_MULTIPLIERS = {
+    'under_18': 1.3,  # Young skin is more sensitive to all ingredients
+    '18_32': 1.0,     # Young adult skin can handle some ingredients better
+    '32_56': 1.1,     # Mature skin needs gentler ingredients
+    '56_plus': 1.4,   # Senior skin is most sensitive
+}
+
+# Skin type adjustments: extra penalty per matched category (once per category)
+# and extra penalty per flagged ingredient, as a fraction of the weightage
+SKIN_TYPE_CATEGORY_PENALTIES = {
+    'dry': (('alcohols', 'sulfates'), 0.2),  # Dry skin is more sensitive to drying ingredients
+    'oily': (('mineral_oil',), 0.3),         # Oily skin is sensitive to comedogenic ones
+}
+SKIN_TYPE_INGREDIENT_PENALTIES = {
+    'combination': 0.1,  # Combination skin needs balanced approach
+}
+SKIN_TYPES = ['dry', 'oily', 'combination', 'sensitive']
+
+
+class Detection(NamedTuple):
+    harmful_found: Dict[str, Dict]
+    category_counts: Dict[int, int]  # category index -> flagged ingredient count
+    total_harmful: int
+    total_weightage: float
+    total_checked: int
+
+
+class ScoringEngine:
+    def __init__(self, bad_ingredients: Dict[str, Dict]):
+        """Compile the matcher and the per-profile weight table for a database."""
+        self.bad_ingredients = bad_ingredients
+        self.matcher = IngredientMatcher(bad_ingredients)
+        self.classifications = ClassificationCache(self.matcher)
+        self.categories = self.matcher.categories
+        self.weightages = [bad_ingredients[c].get('weightage', DEFAULT_WEIGHTAGE) for c in self.categories]
+
+        # (age, skinType) -> (weightage multiplier, extra penalty per matched category,
+        #                     extra penalty fraction of the total weightage)
+        self.profile_weights: Dict[Tuple[str, str], Tuple[float, List[float], float]] = {}
+        for age in [''] + list(AGE_MULTIPLIERS):
+            for skin_type in [''] + SKIN_TYPES:
+                self.profile_weights[(age, skin_type)] = self._build_profile_weights(age, skin_type)
+
+    def _build_profile_weights(self, age: str, skin_type: str):
+        per_category = [0.0] * len(self.categories)
+        if skin_type in SKIN_TYPE_CATEGORY_PENALTIES:
+            keywords, fraction = SKIN_TYPE_CATEGORY_PENALTIES[skin_type]
+            for index, category in enumerate(self.categories):
+                if any(keyword in category for keyword in keywords):
+                    per_category[index] = self.weightages[index] * fraction
+
+        return (
+            AGE_MULTIPLIERS.get(age, 1.0),
+            per_category,
+            SKIN_TYPE_INGREDIENT_PENALTIES.get(skin_type, 0.0)
+        )
+
+    @staticmethod
+    def profile_key(user_profile: Optional[Dict]) -> Tuple[str, str]:
+        """Normalize a user profile to the (age, skinType) key of the weight table; unknown values count as unset."""
+        if not isinstance(user_profile, dict):
+            return ('', '')
+        age = user_profile.get('age', '')
+        skin_type = user_profile.get('skinType', '')
+        return (
+            age if isinstance(age, str) and age in AGE_MULTIPLIERS else '',
+            skin_type if isinstance(skin_type, str) and skin_type in SKIN_TYPES else ''
+        )
+
+    def detect(self, ingredients_list: List[str]) -> Detection:
+        """Flag harmful ingredients, assigning each one to its first matching category."""
+        return self._build_detection(ingredients_list, self.classifications.classify_index)
+
+    def detect_many(self, ingredient_lists: List[List[str]]) -> List[Detection]:
+        """Detect a whole batch of ingredient lists, classifying each distinct ingredient only once."""
+        classified = {}
+        for ingredients_list in ingredient_lists:
+            for ingredient in ingredients_list:
+                if ingredient not in classified:
+                    classified[ingredient] = self.classifications.classify_index(ingredient)
+        return [self._build_detection(ingredients_list, classified.__getitem__) for ingredients_list in ingredient_lists]
+
+    def _build_detection(self, ingredients_list: List[str], classify_index: Callable[[str], int]) -> Detection:
+        harmful_found = {}
+        category_counts = {}
+        found_ingredients = set()  # Track found ingredients to avoid duplicates
+        total_weightage = 0
+
+        for ingredient in ingredients_list:
+            if ingredient in found_ingredients:
+                continue
+            index = classify_index(ingredient)
+            if index == -1:
+                continue
+            hits = [(ingredient, index)]
+            if '(' in ingredient:
+                # The whole token only matches its first category, but one of its names can belong
+                # to a later one ("phenoxyethanol (methylparaben)"); names in the same category are
+                # the same finding
+                for name in synonym_names(ingredient):
+                    synonym_index = self.classifications.classify_index(name)
+                    if synonym_index > index and name not in found_ingredients:
+                        hits.append((name, synonym_index))
+            for name, index in hits:
+                category = self.categories[index]
+                if category not in harmful_found:
+                    data = self.bad_ingredients[category]
+                    harmful_found[category] = {
+                        'description': data['description'],
+                        'severity': data.get('severity', 'MODERATE'),
+                        'weightage': self.weightages[index],
+                        'ingredients': []
+                    }
+                harmful_found[category]['ingredients'].append(name)
+                found_ingredients.add(name)  # Mark as found
+                category_counts[index] = category_counts.get(index, 0) + 1
+                total_weightage += self.weightages[index]
+
+        return Detection(harmful_found, category_counts, len(found_ingredients), total_weightage, len(ingredients_list))
+
+    def summary(self, detection: Detection) -> Dict:
+        """Response fields shared by the basic and personalized analyses."""
+        return {
+            'safe': detection.total_harmful == 0,
+            'harmful_count': detection.total_harmful,
+            'total_weightage': detection.total_weightage,
+            'harmful_ingredients': detection.harmful_found,
+            'total_ingredients_checked': detection.total_checked
+        }
+
+    def analyze(self, ingredients_list: List[str], detection: Optional[Detection] = None) -> Dict:
+        """Basic analysis with the weightage-based safety score."""
+        if detection is None:
+            detection = self.detect(ingredients_list)
+        result = self.summary(detection)
+        result['safety_score'] = max(0, 100 - detection.total_weightage)
+        return result
+
+    def personalized_score(self, detection: Detection, user_profile: Optional[Dict]) -> float:
+        """Score a detection for one profile (unrounded, clamped at 0)."""
+        return self.score_profiles(detection, [user_profile])[0]
+
+    def score_profiles(self, detection: Detection, user_profiles: Iterable[Optional[Dict]]) -> List[float]:
+        """Score one detection against many profiles using the precomputed weight table."""
+        total_weightage = detection.total_weightage
+        hits = list(detection.category_counts)
+        scores = []
+        for user_profile in user_profiles:
+            multiplier, per_category, fraction = self.profile_weights[self.profile_key(user_profile)]
+            # Same order of operations as the original rules, so rounding of .5 scores is unchanged
+            score = max(0, 100 - total_weightage * multiplier)
+            for index in hits:
+                if per_category[index]:
+                    score -= per_category[index]
+            if fraction:
+                score -= total_weightage * fraction
+            scores.append(max(0, score))
+        return scores
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Pre-fork production server for the DermaScan API.
+
+The master imports the app once, so the ingredient database snapshot (matcher,
+score weights, curated recommendation index, preloaded classification cache)
+and every module are built before any worker exists. The garbage collector is
+kept off while they are built and they are then frozen (gc.freeze), so a
+worker's collections never write to them. The workers are forked from the
+master and share those pages copy-on-write: a worker's own memory is what it
+allocates while serving, and memory stays flat as workers are added. Each
+worker serves the ASGI app (asgi.py) with uvicorn on the master's listening
+socket; the kernel hands each connection to one of them.
+
+Signals to the master:
+    HUP        reload the database files and replace every worker with a new
+               one that sees the new snapshot; old workers finish their
+               in-flight requests first (code changes need a restart)
+    TERM, INT  graceful shutdown, waiting up to --graceful-timeout
+Workers are recycled after --max-requests requests (plus up to
+--max-requests-jitter more, so they do not all restart together) and replaced
+whenever they exit. A database change picked up by DATABASE_WATCH_INTERVAL,
+and POST /admin/reload-database in any worker, replace the workers the same
+way as HUP.
+
+With more than one worker, recommendation jobs are shared through a SQLite
+file (RECOMMENDATION_JOBS_DB, a temporary file by default), so a poll can land
+on any worker. Caches, rate limits and /metrics are per worker unless their
+*_DB / SCAN_TRACKER_URL settings point at shared storage. The cache warm-ups
+(WARM_RECOMMENDATIONS, ALTERNATIVES_WARM_INTERVAL) run in each worker as it
+starts. Needs uvicorn, a2wsgi and a platform with fork().
+
+Run from the backend directory:
+    python server.py --workers 4 --port 5000
+"""
+
+import argparse
+import gc
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+WORKER_RESTART_DELAY = 1.0  # seconds before replacing a worker that failed
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    def __init__(self, sock, app, args):
+        self.sock = sock
+        self.app = app
+        self.args = args
+        self.workers = {}  # pid -> generation
+        self.retiring = {}  # pid -> time to kill it if it has not exited
+        self.generation = 0
+        self.version = None
+        self.stopping = False
+        self.restart_at = 0.0
+        self.signals = []
+        self.wakeup_read, self.wakeup_write = os.pipe()
+
+    def run(self):
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(self.wakeup_write, False)
+        signal.set_wakeup_fd(self.wakeup_write)
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, self.on_signal)
+
+        print(f"DermaScan master {os.getpid()} on {self.args.host}:{self.args.port} "
+              f"with {self.args.workers} workers (database version {self.app.DATABASE.current.version})")
+        self.start_generation()
+        while self.workers or not self.stopping:
+            self.reap()
+            signals, self.signals = self.signals, []
+            for sig in signals:
+                if sig == signal.SIGHUP and not self.stopping:
+                    self.reload()
+                elif sig in (signal.SIGTERM, signal.SIGINT):
+                    self.stop()
+            if not self.stopping:
+                if self.app.DATABASE.current.version != self.version:
+                    print(f"Database version {self.app.DATABASE.current.version} loaded, replacing workers")
+                    self.start_generation()
+                self.spawn_missing()
+            self.kill_overdue()
+            self.sleep(0.5)
+        print("DermaScan master stopped")
+
+    def on_signal(self, sig, frame):
+        self.signals.append(sig)
+
+    def sleep(self, timeout):
+        try:
+            ready, _, _ = select.select([self.wakeup_read], [], [], timeout)
+        except InterruptedError:
+            return
+        if ready:
+            try:
+                while os.read(self.wakeup_read, 64):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def start_generation(self):
+        """Fork a full set of workers from the current snapshot and retire the previous ones."""
+        # Objects that exist now are shared with the workers; the collector leaves them alone
+        gc.freeze()
+        self.generation += 1
+        self.version = self.app.DATABASE.current.version
+        previous = [pid for pid, generation in self.workers.items() if generation != self.generation]
+        for _ in range(self.args.workers):
+            self.spawn()
+        self.retire(previous)
+
+    def reload(self):
+        print("Reloading the database")
+        try:
+            self.app.DATABASE.reload()
+        except (OSError, ValueError):
+            pass  # Already reported; the current workers keep serving the current snapshot
+        # Let the collector reclaim the replaced snapshot before the new one is frozen and shared
+        gc.unfreeze()
+        gc.collect()
+        self.start_generation()
+
+    def stop(self):
+        if self.stopping:
+            return
+        print("Shutting down, waiting for in-flight requests")
+        self.stopping = True
+        self.retire(list(self.workers))
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.args.graceful_timeout
+        for pid in pids:
+            self.retiring[pid] = deadline
+            self.signal_worker(pid, signal.SIGTERM)
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                print(f"Worker {pid} did not stop in {self.args.graceful_timeout:.0f}s, killing it")
+                self.signal_worker(pid, signal.SIGKILL)
+                self.retiring[pid] = now + self.args.graceful_timeout
+
+    def signal_worker(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.workers.pop(pid, None)
+            retired = self.retiring.pop(pid, None) is not None
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and not retired:
+                print(f"Worker {pid} exited with code {code}")
+                self.restart_at = time.monotonic() + WORKER_RESTART_DELAY
+            elif generation == self.generation and not retired:
+                print(f"Worker {pid} recycled")
+
+    def spawn_missing(self):
+        current = sum(1 for generation in self.workers.values() if generation == self.generation)
+        if current < self.args.workers and time.monotonic() >= self.restart_at:
+            for _ in range(self.args.workers - current):
+                self.spawn()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = self.generation
+            return
+        code = 0
+        try:
+            self.close_master_state()
+            run_worker(self.sock, self.app, self.args)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def close_master_state(self):
+        signal.set_wakeup_fd(-1)
+        for sig in (signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+
+
+def run_worker(sock, app, args):
+    import asgi
+    import uvicorn
+
+    gc.enable()
+    # uvicorn handles TERM and INT (graceful shutdown) while serving and raises them again
+    # afterwards; they are ignored here so the worker can finish its own cleanup
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda sig, frame: None)
+
+    max_requests = args.max_requests + random.randint(0, args.max_requests_jitter) if args.max_requests else None
+    config = uvicorn.Config(asgi.application, lifespan='on', log_level=args.log_level, access_log=False,
+                            limit_max_requests=max_requests, timeout_graceful_shutdown=args.graceful_timeout)
+    uvicorn.Server(config).run(sockets=[sock])
+    app.DATABASE.save_classifications()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('MAX_REQUESTS', 10000)),
+                        help='requests a worker serves before it is replaced, 0 disables recycling')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(os.environ.get('MAX_REQUESTS_JITTER', 1000)))
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.environ.get('GRACEFUL_TIMEOUT', 30)),
+                        help='seconds a stopping worker gets to finish its requests')
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args()
+
+    # No collections while the shared state is built, so it is packed without freed holes
+    gc.disable()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    import app
+    import asgi  # noqa: F401 - imported once here so the workers share it
+    import uvicorn  # noqa: F401
+
+    # POST /admin/reload-database in a worker asks the master to reload every worker
+    app.RELOAD_MASTER_PID = os.getpid()
+
+    # Job polls must reach the job's state whichever worker answers them
+    jobs_dir = None
+    if args.workers > 1 and not app.RECOMMENDATION_JOBS.db_path:
+        jobs_dir = tempfile.mkdtemp(prefix='dermascan-jobs-')
+        app.RECOMMENDATION_JOBS.db_path = os.path.join(jobs_dir, 'jobs.db')
+
+    try:
+        Master(sock, app, args).run()
+    finally:
+        sock.close()
+        if jobs_dir:
+            for name in os.listdir(jobs_dir):
+                os.remove(os.path.join(jobs_dir, name))
+            os.rmdir(jobs_dir)
+
+
+if __name__ == '__main__':
+    main()
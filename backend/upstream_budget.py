@@ -0,0 +1,100 @@
+"""
+Call-rate limits and daily budgets for metered upstreams (SerpAPI, Gemini).
+
+acquire() never blocks: it either spends one call of the upstream's budget or
+returns False, so callers degrade (skip the lookup, serve cached or curated
+results) instead of queueing behind the quota. Counts live in a scan_tracker
+backend, so with SCAN_TRACKER_URL they are shared by every worker process: the
+rate is a fixed one-second window and the daily budget a window per UTC day.
+An upstream that answers 429 is skipped locally for its Retry-After period.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class UpstreamBudget:
+    def __init__(self, name: str, backend, rate: float = 0, daily_limit: int = 0, log=None, rate_backend=None):
+        """
+        `rate` is calls per second and `daily_limit` calls per UTC day, 0 meaning unlimited.
+        The rate windows are counted in `rate_backend` if given (an in-process store should
+        hold windows of one length), otherwise in `backend` with the daily windows.
+        """
+        self.name = name
+        self.backend = backend
+        self.rate_backend = rate_backend if rate_backend is not None else backend
+        self.rate = rate
+        self.daily_limit = daily_limit
+        self.log = log
+        self._lock = threading.Lock()
+        self._used_today = 0
+        self._day = None
+        self._throttled_until = 0.0
+        self.allowed = 0
+        self.denied = {}
+
+    def acquire(self) -> bool:
+        """Spend one call if the upstream is within its rate and daily budget; never waits."""
+        if self.throttled_for() > 0:
+            return self._deny('throttled')
+        try:
+            if self.rate and self.rate_backend.hit(f'rate:{self.name}', 1) > self.rate:
+                return self._deny('rate')
+            if self.daily_limit:
+                day = time.strftime('%Y-%m-%d', time.gmtime())
+                used = self.backend.hit(f'budget:{self.name}:{day}', 24 * 3600)
+                with self._lock:
+                    self._day, self._used_today = day, used
+                if used > self.daily_limit:
+                    return self._deny('daily_budget')
+        except Exception as e:
+            # The shared store is down: fail open rather than cut off the upstream
+            if self.log is not None:
+                self.log.event('budget_store_unavailable', upstream=self.name, error=str(e))
+        with self._lock:
+            self.allowed += 1
+        return True
+
+    def throttle(self, seconds: float):
+        """Stop calling the upstream for `seconds` (it answered 429)."""
+        with self._lock:
+            self._throttled_until = max(self._throttled_until, time.monotonic() + seconds)
+
+    def throttled_for(self) -> float:
+        return max(0.0, self._throttled_until - time.monotonic())
+
+    def remaining_today(self) -> Optional[int]:
+        """Calls left today as of this worker's last call (None when unlimited)."""
+        if not self.daily_limit:
+            return None
+        with self._lock:
+            used = self._used_today if self._day == time.strftime('%Y-%m-%d', time.gmtime()) else 0
+        return max(0, self.daily_limit - used)
+
+    def fraction_left(self) -> float:
+        """Share of today's budget still available, 0.0 while throttled."""
+        if self.throttled_for() > 0:
+            return 0.0
+        remaining = self.remaining_today()
+        return 1.0 if remaining is None else remaining / self.daily_limit
+
+    def status(self) -> Dict:
+        with self._lock:
+            allowed, denied = self.allowed, dict(self.denied)
+        return {
+            'rate_per_second': self.rate or None,
+            'daily_limit': self.daily_limit or None,
+            'remaining_today': self.remaining_today(),
+            'throttled_for': round(self.throttled_for(), 1),
+            'allowed': allowed,
+            'denied': denied
+        }
+
+    def _deny(self, reason: str) -> bool:
+        with self._lock:
+            self.denied[reason] = self.denied.get(reason, 0) + 1
+        return False
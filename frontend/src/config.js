@@ -0,0 +1,2 @@
+// Backend API the pages talk to
+export const API_BASE_URL = 'http://localhost:5000'
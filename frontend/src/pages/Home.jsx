@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import BarcodeScanner from '../components/BarcodeScanner';
 import axios from 'axios';
+import { API_BASE_URL } from '../config';
 
 const Home = () => {
   const navigate = useNavigate();
@@ -11,8 +12,6 @@ const Home = () => {
   const [showScanner, setShowScanner] = useState(false);
   const [userProfile, setUserProfile] = useState(null);
 
-  const API_BASE_URL = 'http://localhost:5000';
-
   useEffect(() => {
     const user = localStorage.getItem('dermascan-user');
     if (!user) {
@@ -47,6 +46,7 @@ const Home = () => {
             analysis: response.data.analysis,
             productInfo: response.data.product_info,
             ingredientsAnalyzed: response.data.ingredients_analyzed,
+            recommendationsJob: response.data.recommendations_job,
             userProfile: userProfile,
           },
         });
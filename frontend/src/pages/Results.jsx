@@ -1,10 +1,37 @@
-import React from 'react'
+import React, { useState, useEffect } from 'react'
 import { useLocation, useNavigate } from 'react-router-dom'
+import axios from 'axios'
+import { API_BASE_URL } from '../config'
 
 const Results = () => {
   const location = useLocation()
   const navigate = useNavigate()
-  const { analysis, productInfo, ingredientsAnalyzed } = location.state || {}
+  const { analysis, productInfo, ingredientsAnalyzed, recommendationsJob } = location.state || {}
+  const [productRecommendations, setProductRecommendations] = useState(analysis?.product_recommendations || [])
+
+  // Alternatives that were not cached yet are resolved in the background: long-poll the job until it finishes
+  useEffect(() => {
+    if (!recommendationsJob || recommendationsJob.status !== 'pending') return
+    let cancelled = false
+    const poll = async () => {
+      try {
+        while (!cancelled) {
+          const response = await axios.get(`${API_BASE_URL}${recommendationsJob.url}?wait=20`)
+          if (response.data.status !== 'pending') {
+            // A failed job keeps the curated picks already shown
+            if (!cancelled && response.data.status === 'done') {
+              setProductRecommendations(response.data.product_recommendations || [])
+            }
+            return
+          }
+        }
+      } catch (err) {
+        console.error('Recommendations Error:', err)
+      }
+    }
+    poll()
+    return () => { cancelled = true }
+  }, [recommendationsJob])
 
   // If no analysis data, redirect to home
   if (!analysis) {
@@ -304,7 +331,7 @@ const Results = () => {
         )}
 
         {/* Product Recommendations Section */}
-        {analysis.product_recommendations && analysis.product_recommendations.length > 0 && (
+        {productRecommendations.length > 0 && (
           <div className="bg-white rounded-3xl p-8 mb-8 border-4 border-custom-pink shadow-2xl">
             <div className="flex items-center mb-6">
               <h3 className="font-quicksand text-3xl font-bold text-custom-pink uppercase tracking-wider">
@@ -316,7 +343,7 @@ const Results = () => {
             </p>
             
             <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
-              {analysis.product_recommendations.map((product, idx) => (
+              {productRecommendations.map((product, idx) => (
                 <div key={idx} className="border-2 border-custom-pink rounded-2xl p-6 hover:shadow-xl transition-shadow bg-white">
                   {product.link ? (
                     <a 